@@ -1,6 +1,14 @@
 import tkinter as TK; # for the GUI
+import queue; # for passing results from the worker thread back to the GUI
+from concurrent.futures import ThreadPoolExecutor; # for calculating in the background
+import numpy as NP; # for the strike ladder of the chain view
 import Products_and_Pricing as PaP; # for the option class and pricing functions
 
+# Calculations run on a worker thread, so the window never freezes; only the main thread touches the widgets.
+DEBOUNCE_MS = 300; # inputs are recalculated this long after the last change, so typing a number triggers one calculation
+POLL_MS = 50; # how often the main thread checks for finished calculations
+CHAIN_COLUMNS = ["Option value", "Delta", "Gamma", "Vega", "Theta", "Rho"];
+
 def is_float(string): # function to check if input is a number (int or float)
     try:
         float(string); # try converting the string to float
@@ -12,11 +20,13 @@ def price_calc_selected(): # if the user chooses to calculate for price
     price_value.delete(0, 'end'); # the field to give a price is cleared (delete characters from start to end)
     price_value.config(state='disabled'); # the field to give a price is disabled
     volatility_value.config(state='normal'); # the field to give volatility is enabled
+    schedule_calc();
 
 def vol_calc_selected(): # if the user chooses to calculate for volatility
     price_value.config(state='normal'); # the field to give a price is enabled
     volatility_value.delete(0, 'end'); # the field to give volatility is cleared (delete characters from start to end)
     volatility_value.config(state='disabled'); # the field to give volatility is disabled
+    schedule_calc();
 
 # The window
 root = TK.Tk(); # creates the root (main) window
@@ -40,9 +50,9 @@ ROW8 = 200;
 # The radio buttons for the option type with their labels
 option_type = TK.StringVar(value='call'); # the variable controlled by the option type radio buttons
 # the variable is initialised, otherwise both radio buttons would start as selected
-RB_call = TK.Radiobutton(root, text='Call', variable=option_type, value='call');
+RB_call = TK.Radiobutton(root, text='Call', variable=option_type, value='call', command=lambda: schedule_calc());
 RB_call.place(x=COL1, y=ROW1);
-RB_put = TK.Radiobutton(root, text='Put', variable=option_type, value='put');
+RB_put = TK.Radiobutton(root, text='Put', variable=option_type, value='put', command=lambda: schedule_calc());
 RB_put.place(x=COL1, y=ROW2);
 
 # The radio buttons for the calculation type (price or volatility)
@@ -128,42 +138,175 @@ def input_check():
     err_msg.config(text=''); # clear any error messages
     return 1; # all input values are numbers
 
+# The background calculation
+executor = ThreadPoolExecutor(max_workers=1); # a single worker, so requests are calculated in the order they were made
+results_queue = queue.Queue(); # (request number, results) pairs from the worker
+latest_request = 0; # the number of the most recent request; results of older ones are stale and ignored
+pending_future = None; # the most recent request sent to the worker
+pending_after = None; # the scheduled (debounced) calculation, if any
+
+def calculate(request, inputs): # runs on the worker thread, so it must not touch the widgets
+    if request != latest_request: # a newer request was made while this one was waiting, so skip it
+        return None;
+    try:
+        the_option = PaP.Option(inputs['option_type'], 'European', inputs['strike_price'], inputs['time_to_expiry']);
+        market = (inputs['underlying_price'], inputs['risk_free_rate']);
+        results = {};
+        if inputs['calc_type'] == 'price': # if calculating price...
+            volatility = inputs['volatility'];
+            results['price'] = PaP.BSM_price(the_option, *market, volatility, inputs['dividend_yield']);
+        else: # if calculating volatility...
+            implied = PaP.BSM_implied_volatility_batch(inputs['option_type'], inputs['option_price'], inputs['strike_price'],
+                                                       inputs['time_to_expiry'], *market, inputs['dividend_yield']);
+            volatility = implied['Implied volatility'].item();
+            if NP.isnan(volatility):
+                results_queue.put((request, {'error': 'No volatility gives this price!'}));
+                return None;
+            if implied['Status'].item() == PaP.IV_LOW_VEGA: # a valid price, e.g. deep in the money or close to expiry
+                results['warning'] = 'Price barely depends on volatility; the volatility is only an estimate.';
+            results['volatility'] = volatility;
+        # then the greeks:
+        for name, function in [('delta', PaP.BSM_delta), ('gamma', PaP.BSM_gamma), ('vega', PaP.BSM_vega),
+                               ('theta', PaP.BSM_theta), ('rho', PaP.BSM_rho)]:
+            results[name] = function(the_option, *market, volatility, inputs['dividend_yield']);
+        if inputs['chain'] is not None: # the strike ladder of the chain view, priced in one batched call
+            lowest, highest, step = inputs['chain'];
+            strikes = NP.arange(lowest, highest + step/2, step);
+            results['chain'] = (strikes, PaP.BSM_greeks(inputs['option_type'], strikes, inputs['time_to_expiry'], *market,
+                                                        volatility, inputs['dividend_yield']));
+    except Exception as error: # reported in the window rather than lost on the worker thread
+        results = {'error': 'Calculation failed: %s' % error};
+    results_queue.put((request, results));
+
+def set_entry(entry, value): # writes a result into a (normally disabled) entry field
+    entry.config(state='normal'); # activate the entry field to insert the value
+    entry.delete(0, 'end'); # clear any existing value in it
+    entry.insert(0, value);
+    entry.config(state='disabled'); # now deactivate the entry field
+
+def show_results(results):
+    if 'error' in results:
+        err_msg.config(text=results['error']);
+        return None;
+    err_msg.config(text=results.get('warning', ''));
+    if 'price' in results:
+        set_entry(price_value, results['price']);
+    if 'volatility' in results:
+        set_entry(volatility_value, results['volatility']);
+    delta_result.config(text=results['delta']);
+    gamma_result.config(text=results['gamma']);
+    vega_result.config(text=results['vega']);
+    theta_result.config(text=results['theta']);
+    rho_result.config(text=results['rho']);
+    if 'chain' in results and chain_window is not None:
+        strikes, greeks = results['chain'];
+        lines = ['%10s' % 'Strike' + ''.join('%14s' % name for name in CHAIN_COLUMNS)];
+        lines += ['%10.2f' % strike + ''.join('%14.4f' % greeks[name][i] for name in CHAIN_COLUMNS) for i, strike in enumerate(strikes)];
+        chain_text.config(state='normal');
+        chain_text.delete('1.0', 'end');
+        chain_text.insert('1.0', '\n'.join(lines));
+        chain_text.config(state='disabled');
+
+def poll_results(): # runs on the main thread every POLL_MS milliseconds
+    try:
+        while True:
+            request, results = results_queue.get_nowait();
+            if request == latest_request: # results of stale requests are dropped
+                show_results(results);
+    except queue.Empty:
+        pass;
+    root.after(POLL_MS, poll_results);
+
 # The calculation function
 def option_calc():
+    global latest_request, pending_future, pending_after;
+    pending_after = None;
     if input_check() == 1: # if all input checks passed...
-        # first create the variables:
-        strike_price = float(strike_price_value.get());
-        time_to_expiry = float(expiry_value.get());
-        underlying_price = float(underlying_price_value.get());
-        risk_free_rate = float(risk_free_rate_value.get());
-        dividend_yield = float(dividend_yield_value.get());
-        # then create the option object:
-        the_option = PaP.Option(option_type.get(), 'European', strike_price, time_to_expiry);
-        if calc_type.get() == 'price': # if calculating price...
-            volatility = float(volatility_value.get());
-            price_value.config(state='normal'); # activate the entry field to insert the option price
-            price_value.delete(0, 'end'); # clear any existing value in it
-            price_value.insert(0, PaP.BSM_price(the_option, underlying_price, risk_free_rate, volatility, dividend_yield));
-            price_value.config(state='disabled'); # now deactivate the entry field
-        else: # if calculating volatility...
-            option_price = float(price_value.get());
-            volatility_value.config(state='normal'); # activate the entry field to insert the volatility value
-            volatility_value.delete(0, 'end'); # clear any existing value in it
-            volatility = PaP.BSM_implied_volatility(the_option, option_price, underlying_price, risk_free_rate, dividend_yield);
-            volatility_value.insert(0, volatility);
-            volatility_value.config(state='disabled'); # now deactivate the entry field
-        # finally calculate the greeks:
-        delta_result.config(text=PaP.BSM_delta(the_option, underlying_price, risk_free_rate, volatility, dividend_yield));
-        gamma_result.config(text=PaP.BSM_gamma(the_option, underlying_price, risk_free_rate, volatility, dividend_yield));
-        vega_result.config(text=PaP.BSM_vega(the_option, underlying_price, risk_free_rate, volatility, dividend_yield));
-        theta_result.config(text=PaP.BSM_theta(the_option, underlying_price, risk_free_rate, volatility, dividend_yield));
-        rho_result.config(text=PaP.BSM_rho(the_option, underlying_price, risk_free_rate, volatility, dividend_yield));
+        # first read the inputs (widgets can only be read on the main thread):
+        inputs = {
+            'option_type': option_type.get(),
+            'calc_type': calc_type.get(),
+            'strike_price': float(strike_price_value.get()),
+            'time_to_expiry': float(expiry_value.get()),
+            'underlying_price': float(underlying_price_value.get()),
+            'risk_free_rate': float(risk_free_rate_value.get()),
+            'dividend_yield': float(dividend_yield_value.get()),
+            'chain': chain_inputs()
+        };
+        if inputs['calc_type'] == 'price':
+            inputs['volatility'] = float(volatility_value.get());
+        else:
+            inputs['option_price'] = float(price_value.get());
+        # then hand them to the worker, cancelling the previous request if it has not started yet:
+        latest_request += 1;
+        if pending_future is not None:
+            pending_future.cancel();
+        pending_future = executor.submit(calculate, latest_request, inputs);
     else: # if checks not passed:
         return None # do not calculate anything; input_check() will handle the error message
 
-# The button
+def schedule_calc(event=None): # called on every change of the inputs; recalculates once they stop changing
+    global pending_after;
+    if pending_after is not None:
+        root.after_cancel(pending_after);
+    pending_after = root.after(DEBOUNCE_MS, option_calc);
+
+for entry in [strike_price_value, underlying_price_value, expiry_value, risk_free_rate_value, dividend_yield_value, price_value,
+              volatility_value]:
+    entry.bind('<KeyRelease>', schedule_calc);
+
+# The chain view: the selected option type priced over a ladder of strikes, with the other inputs of the main window
+chain_window = None;
+chain_text = None;
+chain_entries = {};
+
+def chain_inputs(): # the (lowest strike, highest strike, step) of the chain view, or None if it is closed or incomplete
+    if chain_window is None:
+        return None;
+    values = [chain_entries[name].get() for name in ('lowest', 'highest', 'step')];
+    if not all(is_float(value) for value in values):
+        return None;
+    lowest, highest, step = [float(value) for value in values];
+    if step <= 0 or highest < lowest or (highest - lowest)/step > 1000:
+        return None;
+    return (lowest, highest, step);
+
+def close_chain():
+    global chain_window;
+    chain_window.destroy();
+    chain_window = None;
+
+def open_chain():
+    global chain_window, chain_text;
+    if chain_window is not None:
+        chain_window.lift();
+        return None;
+    chain_window = TK.Toplevel(root);
+    chain_window.title("Option chain");
+    chain_window.protocol('WM_DELETE_WINDOW', close_chain);
+    strike = float(strike_price_value.get()) if is_float(strike_price_value.get()) else 100.0;
+    for column, (name, text, value) in enumerate([('lowest', 'Lowest strike:', strike*0.8), ('highest', 'Highest strike:', strike*1.2),
+                                                  ('step', 'Step:', strike*0.05)]):
+        TK.Label(chain_window, text=text).grid(row=0, column=2*column, padx=5, pady=5);
+        chain_entries[name] = TK.Entry(chain_window, width=8);
+        chain_entries[name].insert(0, round(value, 2));
+        chain_entries[name].grid(row=0, column=2*column+1, padx=5, pady=5);
+        chain_entries[name].bind('<KeyRelease>', schedule_calc);
+    chain_text = TK.Text(chain_window, width=94, height=25, font='TkFixedFont', state='disabled');
+    chain_text.grid(row=1, column=0, columnspan=6, padx=5, pady=5);
+    option_calc();
+
+def close_window():
+    executor.shutdown(wait=False, cancel_futures=True);
+    root.destroy();
+
+# The buttons
 calc_button = TK.Button(root, text='Calculate', command=option_calc); # creates a button that calls the calculation function
 calc_button.place(x=200, y=240);
+chain_button = TK.Button(root, text='Chain...', command=open_chain); # opens the chain view
+chain_button.place(x=COL4, y=240);
 
+root.protocol('WM_DELETE_WINDOW', close_window);
+root.after(POLL_MS, poll_results);
 root.update_idletasks();
-root.mainloop();
\ No newline at end of file
+root.mainloop();
@@ -0,0 +1,164 @@
+"""
+Headless batch pricer: prices large files of European options from the command line, without a display.
+The input is a csv or Parquet file with one option per row and the columns:
+    option_type ('call'/'put'), strike_price, time_to_expiry (years), underlying_price, risk_free_interest_rate, dividend_yield,
+    and either volatility (to calculate prices) or option_price (to calculate implied volatilities); optionally option_style.
+Market columns that are the same for every row can be given on the command line instead (e.g. --risk-free-rate 0.05).
+The file is read in chunks of fixed size, each chunk is priced with the vectorised functions of Products_and_Pricing in a pool
+of worker processes, and the results are appended to the output file in the input order as soon as they are ready, so memory
+use does not grow with the size of the file. American options are not priced (NaN), and have no implied volatility (NaN, with
+the status IV_NOT_EUROPEAN).
+Example:
+    python Batch_pricer.py options.csv results.csv --chunk-size 500000 --workers 4
+"""
+import argparse;
+import os;
+import sys;
+from collections import deque;
+from concurrent.futures import ProcessPoolExecutor;
+import numpy as NP;
+import pandas as PD;
+import Products_and_Pricing as PaP; # for the vectorised pricing functions
+
+GREEK_COLUMNS = ["Option value", "Delta", "Gamma", "Vega", "Theta", "Theta per day", "Rho"];
+# The input columns that can be given on the command line instead, with their options:
+COMMAND_LINE_OPTIONS = {'underlying_price': '--underlying-price', 'risk_free_interest_rate': '--risk-free-rate',
+                        'dividend_yield': '--dividend-yield', 'volatility': '--volatility'};
+
+def _is_parquet(file_name):
+    return os.path.splitext(file_name)[1].lower() in ('.parquet', '.pq');
+
+def read_chunks(input_file, chunk_size):
+    """
+    Yields the input file as DataFrames of at most chunk_size rows.
+    """
+    if _is_parquet(input_file):
+        import pyarrow.parquet; # optional dependency, only needed for Parquet files
+        for batch in pyarrow.parquet.ParquetFile(input_file).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas();
+    else:
+        yield from PD.read_csv(input_file, chunksize=chunk_size);
+
+def price_chunk(chunk, defaults, decimals=None):
+    """
+    Prices one chunk of options and returns it with the result columns added.
+    'defaults': values for market columns missing from the chunk, e.g. {'risk_free_interest_rate': 0.05}
+    If the chunk has a volatility column, prices and Greeks are calculated; otherwise implied volatilities are calculated from
+    the option_price column first (with their status codes, see BSM_implied_volatility_batch()) and the Greeks from them.
+    """
+    def column(name):
+        return chunk[name].to_numpy() if name in chunk else defaults[name];
+    american = chunk['option_style'].to_numpy() == 'American' if 'option_style' in chunk else NP.zeros(len(chunk), dtype=bool);
+
+    if 'volatility' in chunk or 'volatility' in defaults:
+        volatility = column('volatility');
+    else:
+        # BSM has no implied volatility for American options, which get NaN and the status IV_NOT_EUROPEAN:
+        implied = PaP.BSM_implied_volatility_batch(chunk['option_type'].to_numpy(), chunk['option_price'].to_numpy(),
+                                                   column('strike_price'), column('time_to_expiry'), column('underlying_price'),
+                                                   column('risk_free_interest_rate'), column('dividend_yield'),
+                                                   option_style=american.astype(NP.int8)); # codes, as in OPTION_STYLES
+        volatility = implied["Implied volatility"];
+        chunk = chunk.assign(**{"Implied volatility": volatility, "IV status": implied["Status"]});
+
+    results = PaP.BSM_greeks(chunk['option_type'].to_numpy(), column('strike_price'), column('time_to_expiry'),
+                             column('underlying_price'), column('risk_free_interest_rate'), volatility, column('dividend_yield'),
+                             decimals);
+    results = {name: NP.where(american, NP.nan, values) for name, values in results.items()};
+    return chunk.assign(**{name: NP.broadcast_to(results[name], len(chunk)) for name in GREEK_COLUMNS});
+
+class _Writer:
+    """
+    Appends priced chunks to a csv or Parquet output file.
+    """
+    def __init__(self, output_file):
+        self.output_file = output_file;
+        self.parquet_writer = None;
+        self.first_chunk = True;
+    def write(self, chunk):
+        if _is_parquet(self.output_file):
+            import pyarrow; # optional dependency, only needed for Parquet files
+            import pyarrow.parquet;
+            table = pyarrow.Table.from_pandas(chunk, preserve_index=False);
+            if self.parquet_writer is None:
+                self.parquet_writer = pyarrow.parquet.ParquetWriter(self.output_file, table.schema);
+            self.parquet_writer.write_table(table);
+        else:
+            chunk.to_csv(self.output_file, mode='w' if self.first_chunk else 'a', header=self.first_chunk, index=False);
+        self.first_chunk = False;
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close();
+
+def price_file(input_file, output_file, chunk_size=100000, workers=None, defaults=None, decimals=None):
+    """
+    Prices every option in input_file and writes the results to output_file (csv or Parquet, chosen by the file extension).
+    'workers': the number of worker processes; None uses all CPUs and 1 prices in this process
+    At most two chunks per worker are in flight at any time, which bounds the memory used. Returns the number of rows priced.
+    """
+    defaults = defaults or {};
+    if workers is None:
+        workers = os.cpu_count() or 1;
+    writer = _Writer(output_file);
+    rows = 0;
+    try:
+        if workers == 1:
+            for chunk in read_chunks(input_file, chunk_size):
+                writer.write(price_chunk(chunk, defaults, decimals));
+                rows += len(chunk);
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = deque(); # futures in input order
+                for chunk in read_chunks(input_file, chunk_size):
+                    pending.append(executor.submit(price_chunk, chunk, defaults, decimals));
+                    if len(pending) >= 2*workers: # waits for the oldest chunk before reading more
+                        priced = pending.popleft().result();
+                        writer.write(priced);
+                        rows += len(priced);
+                while pending:
+                    priced = pending.popleft().result();
+                    writer.write(priced);
+                    rows += len(priced);
+    finally:
+        writer.close();
+    return rows;
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prices a csv or Parquet file of European options in chunks, without a GUI.");
+    parser.add_argument('input_file', help="csv or Parquet file with one option per row");
+    parser.add_argument('output_file', help="csv or Parquet file for the results (chosen by the extension)");
+    parser.add_argument('--chunk-size', type=int, default=100000, help="rows priced at a time (default: 100000)");
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all CPUs)");
+    parser.add_argument('--decimals', type=int, default=None, help="round the results (default: full precision)");
+    parser.add_argument('--underlying-price', type=float, help="underlying price for all rows, if there is no such column");
+    parser.add_argument('--risk-free-rate', type=float, help="risk-free interest rate for all rows, if there is no such column");
+    parser.add_argument('--dividend-yield', type=float, help="dividend yield for all rows, if there is no such column");
+    parser.add_argument('--volatility', type=float, help="volatility for all rows, if there is no such column");
+    arguments = parser.parse_args(argv);
+
+    defaults = {name: value for name, value in [('underlying_price', arguments.underlying_price),
+                                                ('risk_free_interest_rate', arguments.risk_free_rate),
+                                                ('dividend_yield', arguments.dividend_yield),
+                                                ('volatility', arguments.volatility)] if value is not None};
+    try:
+        rows = price_file(arguments.input_file, arguments.output_file, arguments.chunk_size, arguments.workers, defaults,
+                          arguments.decimals);
+    except KeyError as error:
+        column = error.args[0];
+        if column == 'option_price': # only needed when there is no volatility
+            print("Batch pricing failed: missing input column 'volatility' or 'option_price' (or give the volatility with --volatility)",
+                  file=sys.stderr);
+        elif column in COMMAND_LINE_OPTIONS:
+            print("Batch pricing failed: missing input column '%s' (or give it with %s)" % (column, COMMAND_LINE_OPTIONS[column]),
+                  file=sys.stderr);
+        else:
+            print("Batch pricing failed: missing input column '%s'" % column, file=sys.stderr);
+        return 1;
+    except (OSError, ValueError, ImportError) as error:
+        print("Batch pricing failed: %s" % error, file=sys.stderr);
+        return 1;
+    print("Priced %d options into %s" % (rows, arguments.output_file));
+    return 0;
+
+if __name__ == '__main__':
+    sys.exit(main());
@@ -0,0 +1,341 @@
+"""
+Benchmarks for the pricing and risk functions, with synthetic data so that runs are reproducible.
+Each benchmark is timed several times and the best time is kept. The results are saved as json; if a baseline file from an
+earlier run is given, the run fails (exit code 1) when any benchmark is slower than its baseline by more than the tolerance.
+The import time of Products_and_Pricing and Risk_Metrics is also measured, in fresh interpreters, and the run fails if it
+exceeds IMPORT_TIME_BUDGETS (see the README), or if any American approximation is less accurate or slower against BSM than
+AMERICAN_APPROXIMATION_BUDGETS allow. Correctness checks that need fresh interpreters are in tests/ (python -m pytest tests).
+Example:
+    python Benchmarks.py --output bench_output.json                        # records a run
+    python Benchmarks.py --baseline bench_baseline.json --tolerance 0.5    # compares with a stored run
+"""
+import os;
+import argparse;
+import contextlib;
+import io;
+import json;
+import platform;
+import subprocess;
+import sys;
+import tempfile;
+import time;
+import numpy as NP;
+import pandas as PD;
+import Products_and_Pricing as PaP;
+import Risk_Metrics as RM;
+from Volatility_surface import Volatility_surface;
+import Scenario_analysis;
+import American_approximations;
+import Finite_difference;
+
+# Maximum import time of each module in seconds, with its heavy dependencies loaded lazily:
+IMPORT_TIME_BUDGETS = {
+    'Products_and_Pricing': 0.25,
+    'Risk_Metrics': 0.25
+};
+
+#################### Synthetic data ####################
+def Synthetic_price_history(file_name, days, volatility=0.2, seed=0, with_log_returns=False):
+    """
+    Writes a Yahoo! Finance style csv file with 'days' rows of a geometric Brownian motion, most recent date first.
+    If with_log_returns is true, a 'Log return' column is added, as required by EWMA_volatility() and Binomial_VaR_backtesting().
+    """
+    generator = NP.random.default_rng(seed);
+    daily_returns = generator.normal(0, volatility/NP.sqrt(252), days);
+    prices = 100*NP.exp(NP.cumsum(daily_returns))[::-1];
+    dates = PD.bdate_range(end='2024-12-31', periods=days)[::-1];
+    price_data = PD.DataFrame({'Open': prices, 'High': prices*1.01, 'Low': prices*0.99, 'Close': prices, 'Adj. close': prices,
+                               'Volume': generator.integers(10**5, 10**7, days)}, index=PD.Index(dates, name='Date'));
+    if with_log_returns:
+        price_data['Log return'] = NP.log(price_data['Adj. close'] / price_data['Adj. close'].shift(-1));
+        price_data = price_data.dropna();
+    price_data.to_csv(file_name);
+    return file_name;
+
+def Synthetic_option_chain(size, seed=0):
+    """
+    A dictionary of arrays describing 'size' European options on an underlying priced at 100, with their market inputs and
+    BSM prices, in the column format used by BSM_book_price() and the batch functions.
+    """
+    generator = NP.random.default_rng(seed);
+    chain = {
+        'option_type': NP.where(generator.random(size) < 0.5, 'call', 'put'),
+        'strike_price': generator.uniform(60, 140, size),
+        'time_to_expiry': generator.uniform(0.05, 2, size),
+        'underlying_price': NP.full(size, 100.0),
+        'risk_free_interest_rate': generator.uniform(0, 0.06, size),
+        'volatility': generator.uniform(0.1, 0.6, size),
+        'dividend_yield': generator.uniform(0, 0.03, size)
+    };
+    chain['option_price'] = PaP.BSM_price_batch(chain['option_type'], chain['strike_price'], chain['time_to_expiry'],
+                                                chain['underlying_price'], chain['risk_free_interest_rate'], chain['volatility'],
+                                                chain['dividend_yield']);
+    return chain;
+
+def _options(chain):
+    return [PaP.Option(chain['option_type'][i], 'European', chain['strike_price'][i], chain['time_to_expiry'][i])
+            for i in range(len(chain['strike_price']))];
+
+#################### Timing ####################
+def _best_time(function, repeats):
+    """
+    The shortest of 'repeats' timings of function(), in seconds.
+    """
+    timings = [];
+    for _ in range(repeats):
+        start = time.perf_counter();
+        function();
+        timings.append(time.perf_counter() - start);
+    return min(timings);
+
+def _benchmarks(folder, quick):
+    """
+    The benchmarks as (name, function) pairs. Sizes are reduced if 'quick' is true.
+    """
+    chain_sizes = [100, 1000] if quick else [100, 1000, 10000];
+    step_counts = [10, 100] if quick else [10, 100, 1000];
+    history_years = [1, 5] if quick else [1, 5, 20];
+    benchmarks = [];
+
+    for size in chain_sizes:
+        chain = Synthetic_option_chain(size);
+        options = _options(chain);
+        market = [(chain['underlying_price'][i], chain['risk_free_interest_rate'][i], chain['volatility'][i],
+                   chain['dividend_yield'][i]) for i in range(size)];
+        benchmarks.append(("BSM_price loop, %d options" % size,
+                           lambda options=options, market=market: [PaP.BSM_price(option, *inputs) for option, inputs in zip(options, market)]));
+        benchmarks.append(("Option_Stats loop, %d options" % size,
+                           lambda options=options, market=market: [PaP.Option_Stats(option, *inputs) for option, inputs in zip(options, market)]));
+        benchmarks.append(("BSM_price_batch, %d options" % size,
+                           lambda chain=chain: PaP.BSM_price_batch(chain['option_type'], chain['strike_price'], chain['time_to_expiry'],
+                                                                   chain['underlying_price'], chain['risk_free_interest_rate'],
+                                                                   chain['volatility'], chain['dividend_yield'])));
+        benchmarks.append(("BSM_greeks, %d options" % size,
+                           lambda chain=chain: PaP.BSM_greeks(chain['option_type'], chain['strike_price'], chain['time_to_expiry'],
+                                                              chain['underlying_price'], chain['risk_free_interest_rate'],
+                                                              chain['volatility'], chain['dividend_yield'], None)));
+        benchmarks.append(("BSM_implied_volatility loop, %d options" % min(size, 1000),
+                           lambda options=options[:1000], chain=chain: [PaP.BSM_implied_volatility(option, chain['option_price'][i],
+                               chain['underlying_price'][i], chain['risk_free_interest_rate'][i], chain['dividend_yield'][i])
+                               for i, option in enumerate(options)]));
+        benchmarks.append(("BSM_implied_volatility_batch, %d options" % size,
+                           lambda chain=chain: PaP.BSM_implied_volatility_batch(chain['option_type'], chain['option_price'],
+                               chain['strike_price'], chain['time_to_expiry'], chain['underlying_price'],
+                               chain['risk_free_interest_rate'], chain['dividend_yield'])));
+        for method in American_approximations.METHODS:
+            benchmarks.append(("American_price_batch, %s, %d options" % (method, size),
+                               lambda chain=chain, method=method: American_approximations.American_price_batch(chain['option_type'],
+                                   chain['strike_price'], chain['time_to_expiry'], chain['underlying_price'],
+                                   chain['risk_free_interest_rate'], chain['volatility'], chain['dividend_yield'], method)));
+
+    surface_chain = Synthetic_option_chain(1000);
+    surface_chain['time_to_expiry'] = NP.maximum(NP.round(surface_chain['time_to_expiry'], 1), 0.1); # twenty expiries
+    surface_chain['option_price'] = PaP.BSM_price_batch(surface_chain['option_type'], surface_chain['strike_price'],
+                                                        surface_chain['time_to_expiry'], 100, 0.03, surface_chain['volatility'], 0.01);
+    benchmarks.append(("Volatility_surface build, 1000 quotes",
+                       lambda chain=surface_chain: Volatility_surface(chain['option_type'], chain['strike_price'], chain['time_to_expiry'],
+                                                                      chain['option_price'], 100, 0.03, 0.01)));
+    surface = Volatility_surface(surface_chain['option_type'], surface_chain['strike_price'], surface_chain['time_to_expiry'],
+                                 surface_chain['option_price'], 100, 0.03, 0.01);
+    lookups = 10**5 if quick else 10**6;
+    generator = NP.random.default_rng(0);
+    strikes, expiries = generator.uniform(60, 140, lookups), generator.uniform(0.05, 2, lookups);
+    benchmarks.append(("Volatility_surface lookup, %d points" % lookups,
+                       lambda strikes=strikes, expiries=expiries: surface.volatility(strikes, expiries)));
+
+    scenario_book = PaP.Option_book(surface_chain['option_type'], 'European', surface_chain['strike_price'], surface_chain['time_to_expiry']);
+    benchmarks.append(("Scenario_revaluation, 1000 options, 40x20x5 scenarios",
+                       lambda book=scenario_book: Scenario_analysis.Scenario_revaluation(book, 1, 100, 0.03, 0.2, 0.01,
+                           NP.linspace(-0.2, 0.2, 40), NP.linspace(-0.1, 0.1, 20), NP.arange(5)/252)));
+
+    for style in ['European', 'American']:
+        option = PaP.Option('put', style, 100, 1);
+        for steps in step_counts:
+            benchmarks.append(("Binomial_price, %s, %d steps" % (style, steps),
+                               lambda option=option, steps=steps: PaP.Binomial_price(option, steps, 1.01, 0.99, 0.05, 100, 0.01)));
+            benchmarks.append(("Binomial_price_with_volatility, %s, %d steps" % (style, steps),
+                               lambda option=option, steps=steps: PaP.Binomial_price_with_volatility(option, steps, 0.2, 0.05, 100, 0.01)));
+
+    option = PaP.Option('put', 'American', 100, 1);
+    for steps in step_counts:
+        benchmarks.append(("Lattice_Option_Stats, American, %d steps" % steps,
+                           lambda option=option, steps=steps: PaP.Lattice_Option_Stats(option, steps, 0.2, 0.05, 100, 0.01)));
+
+    strike_book = PaP.Option_book(NP.where(NP.arange(41) % 2, 'call', 'put'), 'American', NP.linspace(80, 120, 41), 1);
+    for method in Finite_difference.EARLY_EXERCISE_METHODS:
+        benchmarks.append(("Finite_difference_price, %s, 41 options, 200x200 grid" % method,
+                           lambda book=strike_book, method=method: Finite_difference.Finite_difference_price(book, 200, 200, 0.2, 0.05,
+                                                                                                              100, 0.01, method)));
+
+    for years in history_years:
+        price_file = Synthetic_price_history(os.path.join(folder, 'prices_%d.csv' % years), years*252 + 10, seed=years);
+        returns_file = Synthetic_price_history(os.path.join(folder, 'returns_%d.csv' % years), years*252 + 10, seed=years,
+                                               with_log_returns=True);
+        benchmarks.append(("Stats_on_csv, %d years, 10-day holding period" % years,
+                           lambda price_file=price_file, years=years: RM.Stats_on_csv(price_file, years, 10, 0.99, save_file=False, plot=False)));
+        benchmarks.append(("EWMA_volatility, %d years" % years,
+                           lambda returns_file=returns_file: RM.EWMA_volatility(returns_file, 0.94)));
+        benchmarks.append(("Binomial_VaR_backtesting, %d years" % years,
+                           lambda returns_file=returns_file: RM.Binomial_VaR_backtesting(returns_file, 0.03, 0.99, 0.95)));
+    return benchmarks;
+
+#################### Lattice accuracy ####################
+# American options with a range of moneyness, expiries, rates and dividends: (type, S0, K, T, r, volatility, q)
+LATTICE_TEST_OPTIONS = [('put', 100, 100, 1, 0.05, 0.2, 0.0), ('put', 90, 100, 0.5, 0.08, 0.3, 0.0),
+                        ('call', 100, 100, 1, 0.03, 0.25, 0.07), ('put', 100, 100, 3, 0.06, 0.35, 0.02),
+                        ('put', 100, 130, 1.25, 0.03, 0.45, 0.02), ('put', 110, 100, 0.25, 0.04, 0.3, 0.0)];
+
+def Lattice_accuracy(step_counts=(25, 51, 101, 201), repeats=3, reference_steps=4001):
+    """
+    Accuracy against time of each lattice method of Lattice_price(), plain, with Richardson extrapolation, with the
+    control variate and with both, on LATTICE_TEST_OPTIONS (extrapolation only for SMOOTH_LATTICE_METHODS, since
+    Lattice_price() ignores it for the others). The reference prices are Leisen-Reimer prices with 'reference_steps' steps,
+    extrapolated.
+    Returns a list of dictionaries with the method, the settings, the steps, the largest absolute error over the test options
+    and the best time to price all of them, in seconds.
+    """
+    def price_all(steps, method, extrapolate, control_variate):
+        return [PaP.Lattice_price(PaP.Option(option_type, 'American', K, T), steps, sigma, Rf, S0, q, method, extrapolate,
+                                  control_variate) for option_type, S0, K, T, Rf, sigma, q in LATTICE_TEST_OPTIONS];
+    reference = NP.array(price_all(reference_steps, 'Leisen-Reimer', True, True));
+    results = [];
+    for method in PaP.LATTICE_METHODS:
+        for extrapolate, control_variate in [(False, False), (True, False), (False, True), (True, True)]:
+            if extrapolate and method not in PaP.SMOOTH_LATTICE_METHODS:
+                continue;
+            for steps in step_counts:
+                errors = NP.abs(NP.array(price_all(steps, method, extrapolate, control_variate)) - reference);
+                seconds = _best_time(lambda: price_all(steps, method, extrapolate, control_variate), repeats);
+                results.append({"Method": method, "Richardson extrapolation": extrapolate, "Control variate": control_variate,
+                                "Steps": steps, "Max error": float(errors.max()), "Seconds": seconds});
+    return results;
+
+#################### American approximations ####################
+# The most each approximation may be off a converged lattice on LATTICE_TEST_OPTIONS, as a fraction of the lattice price, and
+# the most it may take against BSM_price_batch() on the same chain. Bjerksund-Stensland and Barone-Adesi-Whaley are only
+# accurate to about a percent (see American_approximations), so their accuracy budgets only catch errors beyond their measured
+# ones (1.2% and 1.5%); Andersen-Lake-Offengeld is held to 1bp (measured 0.3bp):
+AMERICAN_APPROXIMATION_BUDGETS = {
+    'Bjerksund-Stensland': {"Max relative error": 0.015, "Time against BSM_price_batch": 40},
+    'Barone-Adesi-Whaley': {"Max relative error": 0.02, "Time against BSM_price_batch": 12},
+    'Andersen-Lake-Offengeld': {"Max relative error": 0.0001, "Time against BSM_price_batch": 100}
+};
+
+def American_approximation_checks(size=10**5, repeats=3, reference_steps=2001):
+    """
+    The largest relative error of each method of American_approximations against extrapolated Leisen-Reimer prices with
+    'reference_steps' steps on LATTICE_TEST_OPTIONS, and its best time on a synthetic chain of 'size' options divided by the
+    best time of BSM_price_batch() on the same chain.
+    Returns a dictionary of method: {"Max relative error": ..., "Time against BSM_price_batch": ...}.
+    """
+    reference = NP.array([PaP.Lattice_price(PaP.Option(option_type, 'American', K, T), reference_steps, sigma, Rf, S0, q)
+                          for option_type, S0, K, T, Rf, sigma, q in LATTICE_TEST_OPTIONS]);
+    option_types, spots, strikes, expiries, rates, volatilities, dividends = [NP.array(column) for column in zip(*LATTICE_TEST_OPTIONS)];
+    chain = Synthetic_option_chain(size);
+    inputs = [chain[name] for name in ('option_type', 'strike_price', 'time_to_expiry', 'underlying_price', 'risk_free_interest_rate',
+                                       'volatility', 'dividend_yield')];
+    BSM_seconds = _best_time(lambda: PaP.BSM_price_batch(*inputs), repeats);
+    results = {};
+    for method in American_approximations.METHODS:
+        prices = American_approximations.American_price_batch(option_types, strikes, expiries, spots, rates, volatilities, dividends,
+                                                              method);
+        results[method] = {"Max relative error": float(NP.max(NP.abs(prices - reference)/reference)),
+                           "Time against BSM_price_batch": _best_time(lambda: American_approximations.American_price_batch(
+                               *inputs, method=method), repeats)/BSM_seconds};
+    return results;
+
+def Run_benchmarks(quick=False, repeats=3, use_price_cache=False):
+    """
+    Runs all benchmarks and returns a dictionary with the environment and the best time of each benchmark in seconds.
+    'use_price_cache': if false (the default), csv files are parsed on every call, as they would be the first time
+    """
+    previous_setting = RM.PRICE_CACHE_ENABLED;
+    RM.Configure_price_cache(enabled=use_price_cache);
+    results = {};
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            for name, function in _benchmarks(folder, quick):
+                with contextlib.redirect_stdout(io.StringIO()): # e.g. the verdicts printed by Binomial_VaR_backtesting()
+                    function(); # warm-up, e.g. to fill the price history cache
+                    results[name] = _best_time(function, repeats);
+    finally:
+        RM.Configure_price_cache(enabled=previous_setting);
+    return {
+        "Environment": {"Python": platform.python_version(), "NumPy": NP.__version__, "pandas": PD.__version__,
+                        "Platform": platform.platform(), "Quick": quick, "Price cache": use_price_cache},
+        "Results": results
+    };
+
+def Measure_import_time(module_name, repeats=3):
+    """
+    The shortest time, in seconds, to import a module in a fresh Python interpreter (so nothing is already loaded).
+    """
+    script = "import time; start = time.perf_counter(); import %s; print(time.perf_counter() - start)" % module_name;
+    folder = os.path.dirname(os.path.abspath(__file__));
+    return min(float(subprocess.run([sys.executable, '-c', script], cwd=folder, capture_output=True, text=True, check=True).stdout)
+               for _ in range(repeats));
+
+def Compare_with_baseline(results, baseline, tolerance):
+    """
+    Returns the benchmarks slower than their baseline by more than 'tolerance' (e.g. 0.25 for 25%), as a dictionary of
+    name: (baseline seconds, current seconds). Benchmarks missing from either run are ignored.
+    """
+    regressions = {};
+    for name, seconds in results["Results"].items():
+        baseline_seconds = baseline["Results"].get(name);
+        if baseline_seconds is not None and seconds > baseline_seconds*(1+tolerance):
+            regressions[name] = (baseline_seconds, seconds);
+    return regressions;
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Times the pricing and risk functions on synthetic data.");
+    parser.add_argument('--output', default='bench_output.json', help="json file for the results (default: bench_output.json)");
+    parser.add_argument('--baseline', help="json file of an earlier run to compare with");
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown against the baseline (default: 0.25)");
+    parser.add_argument('--repeats', type=int, default=3, help="timings per benchmark; the best is kept (default: 3)");
+    parser.add_argument('--quick', action='store_true', help="smaller data sizes");
+    parser.add_argument('--price-cache', action='store_true', help="time csv loading with the price history cache enabled");
+    parser.add_argument('--lattice-accuracy', action='store_true', help="also measure accuracy against time of the lattice methods");
+    arguments = parser.parse_args(argv);
+
+    results = Run_benchmarks(arguments.quick, arguments.repeats, arguments.price_cache);
+    results["Import times"] = {name: Measure_import_time(name, arguments.repeats) for name in IMPORT_TIME_BUDGETS};
+    results["American approximations"] = American_approximation_checks(10**4 if arguments.quick else 10**5, arguments.repeats);
+    if arguments.lattice_accuracy:
+        results["Lattice accuracy"] = Lattice_accuracy(repeats=arguments.repeats);
+    with open(arguments.output, 'w') as output:
+        json.dump(results, output, indent=2);
+    for name, seconds in results["Results"].items():
+        print("%-60s %10.6f s" % (name, seconds));
+    for row in results.get("Lattice accuracy", []):
+        settings = " + ".join([name for name in ("Richardson extrapolation", "Control variate") if row[name]]) or "plain";
+        print("%-15s %-42s %5d steps: max error %.5f in %.6f s" % (row["Method"], settings, row["Steps"], row["Max error"],
+                                                                    row["Seconds"]));
+
+    # Every check runs and reports before the exit code is returned
+    failed = False;
+    for name, seconds in results["Import times"].items():
+        print("%-60s %10.6f s (budget %.3f s)" % ("import " + name, seconds, IMPORT_TIME_BUDGETS[name]));
+        if seconds > IMPORT_TIME_BUDGETS[name]:
+            print("OVER BUDGET: importing %s took %.3f s" % (name, seconds));
+            failed = True;
+    for method, checks in results["American approximations"].items():
+        for name, value in checks.items():
+            print("%-60s %10.4g (budget %g)" % ("%s, %s" % (method, name), value, AMERICAN_APPROXIMATION_BUDGETS[method][name]));
+            if value > AMERICAN_APPROXIMATION_BUDGETS[method][name]:
+                print("OVER BUDGET: %s: %s is %.4g" % (method, name, value));
+                failed = True;
+
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline_file:
+            baseline = json.load(baseline_file);
+        regressions = Compare_with_baseline(results, baseline, arguments.tolerance);
+        for name, (baseline_seconds, seconds) in regressions.items():
+            print("REGRESSION: %s took %.6f s against %.6f s in the baseline" % (name, seconds, baseline_seconds));
+            failed = True;
+        if not regressions:
+            print("No regressions beyond %.0f%% of the baseline." % (arguments.tolerance*100));
+    return 1 if failed else 0;
+
+if __name__ == '__main__':
+    sys.exit(main());
@@ -0,0 +1,198 @@
+"""
+Finite-difference pricing of European and American options: one solve of the BSM partial differential equation gives the
+option's value at every underlying price of a grid and every time step, so a whole risk ladder comes from a single run.
+The PDE is solved backwards from expiry with the Crank-Nicolson scheme, preceded by four half-size fully implicit steps
+(Rannacher smoothing) so that the kink of the payoff does not cause oscillations in delta and gamma. Each time step is a
+tridiagonal system: European options are solved with LAPACK's banded solver, and American options with either
+- 'Brennan-Schwartz': a direct elimination in which early exercise is applied during the back substitution, exact for calls
+  and puts in one pass (the factorisation is computed once per step size and reused)
+- 'PSOR': projected successive over-relaxation, with red-black ordering so that every half sweep is one vectorised operation
+All options of a book that share an expiry are priced together on the same grid: the matrix is the same for every strike,
+so each solve handles all of them at once.
+Example:
+    results = Finite_difference.Finite_difference_price(PaP.Option('put', 'American', 100, 1), 200, 200, 0.2, 0.05, 100, 0.01);
+    results["Option value"], results["Delta"], results["Underlying prices"], results["Value grid"]
+"""
+import math;
+import numpy as NP;
+import Products_and_Pricing as PaP; # for the product classes
+from Lazy_import import Lazy_import;
+scipy = Lazy_import('scipy');
+Lazy_import('scipy.linalg');
+
+EARLY_EXERCISE_METHODS = ['Brennan-Schwartz', 'PSOR'];
+RANNACHER_STEPS = 4; # fully implicit half steps replacing the first two Crank-Nicolson steps
+
+def _Brennan_Schwartz_factors(lower, diagonal, upper):
+    """
+    The pivots and multipliers of the top-down elimination of a tridiagonal matrix, used by _Brennan_Schwartz(). They only
+    depend on the matrix, so they are computed once for all time steps of the same size.
+    'lower', 'diagonal', 'upper': the coefficients of V[i-1], V[i] and V[i+1] in row i
+    """
+    size = len(diagonal);
+    pivots = NP.array(diagonal, dtype=float);
+    multipliers = NP.zeros(size);
+    for i in range(size-2, -1, -1):
+        multipliers[i] = upper[i]/pivots[i+1];
+        pivots[i] = diagonal[i] - multipliers[i]*lower[i+1];
+    return pivots, multipliers;
+
+def _Brennan_Schwartz(lower, pivots, multipliers, right_hand_side, exercise_values):
+    """
+    Solves the tridiagonal system for American options whose exercise region is at the low end of the grid (puts), with one
+    column per option. The rows are eliminated from the top of the grid down (a bidiagonal solve, done by LAPACK); the
+    substitution then runs upwards from the bottom, taking the larger of the continuation and the exercise value at each
+    node, which gives the exact solution of the early exercise problem in one pass. Calls are solved on the reversed grid.
+    """
+    size = len(pivots);
+    bidiagonal = NP.vstack([NP.concatenate([[0.0], multipliers[:-1]]), NP.ones(size)]);
+    eliminated = scipy.linalg.solve_banded((0, 1), bidiagonal, right_hand_side, check_finite=False);
+    values = NP.empty_like(eliminated);
+    values[0] = NP.maximum(eliminated[0]/pivots[0], exercise_values[0]);
+    lower, pivots = lower.tolist(), pivots.tolist();
+    for i in range(1, size):
+        values[i] = NP.maximum((eliminated[i] - lower[i]*values[i-1])/pivots[i], exercise_values[i]);
+    return values;
+
+def _PSOR(lower, diagonal, upper, right_hand_side, exercise_values, initial_values, relaxation=1.2, tolerance=1e-10, max_iterations=1000):
+    """
+    Projected SOR for the same system as _Brennan_Schwartz(), with red-black ordering: the even rows depend only on the odd
+    rows and vice versa, so each half sweep updates every second row of every column at once.
+    """
+    values = NP.maximum(initial_values, exercise_values);
+    lower, diagonal, upper = lower[:, None], diagonal[:, None], upper[:, None];
+    for _ in range(max_iterations):
+        largest_change = 0.0;
+        for start in (0, 1):
+            neighbours = NP.zeros_like(values);
+            neighbours[1:] += lower[1:]*values[:-1];
+            neighbours[:-1] += upper[:-1]*values[1:];
+            rows = slice(start, None, 2);
+            updated = NP.maximum(values[rows] + relaxation*((right_hand_side[rows] - neighbours[rows])/diagonal[rows] - values[rows]),
+                                 exercise_values[rows]);
+            largest_change = max(largest_change, float(NP.abs(updated - values[rows]).max(initial=0.0)));
+            values[rows] = updated;
+        if largest_change < tolerance:
+            break;
+    return values;
+
+def _boundary_values(is_call, is_american, K, time_to_expiry, maximum_price, Rf, q):
+    # Option values at the lowest (zero) and highest underlying price of the grid
+    if is_call:
+        upper_value = maximum_price*math.e**(-q*time_to_expiry) - K*NP.exp(-Rf*time_to_expiry);
+        return NP.zeros_like(K), NP.maximum(upper_value, maximum_price - K) if is_american else upper_value;
+    return (K if is_american else K*NP.exp(-Rf*time_to_expiry)), NP.zeros_like(K);
+
+def _solve_group(is_call, is_american, K, underlying_prices, time_levels, sigma, Rf, q, early_exercise):
+    """
+    Solves the PDE for options of the same type and style (one column per strike) and returns their values on the grid,
+    shaped (options, time levels, underlying prices).
+    """
+    nodes = NP.arange(1, len(underlying_prices)-1); # the interior nodes, S = i*dS
+    # The BSM operator at node i: lower*V[i-1] + centre*V[i] + upper*V[i+1]
+    lower = 0.5*sigma**2*nodes**2 - 0.5*(Rf-q)*nodes;
+    centre = -(sigma**2*nodes**2 + Rf);
+    upper = 0.5*sigma**2*nodes**2 + 0.5*(Rf-q)*nodes;
+    exercise_values = NP.maximum((underlying_prices[:, None] - K) if is_call else (K - underlying_prices[:, None]), 0.0);
+
+    grid = NP.empty((len(time_levels), len(underlying_prices), len(K)));
+    grid[0] = exercise_values;
+    factors = {}; # step size: Brennan-Schwartz factors
+    for n in range(1, len(time_levels)):
+        step = time_levels[n] - time_levels[n-1];
+        implicit_weight = 1.0 if n <= RANNACHER_STEPS else 0.5;
+        previous = grid[n-1];
+        low, high = _boundary_values(is_call, is_american, K, time_levels[n], underlying_prices[-1], Rf, q);
+        # Right-hand side: the explicit part of the step plus the new boundary values of the implicit part
+        right_hand_side = previous[1:-1] + (1-implicit_weight)*step*(lower[:, None]*previous[:-2] + centre[:, None]*previous[1:-1]
+                                                                    + upper[:, None]*previous[2:]);
+        right_hand_side[0] += implicit_weight*step*lower[0]*low;
+        right_hand_side[-1] += implicit_weight*step*upper[-1]*high;
+        sub_diagonal = -implicit_weight*step*lower;
+        diagonal = 1 - implicit_weight*step*centre;
+        super_diagonal = -implicit_weight*step*upper;
+        if not is_american:
+            banded = NP.vstack([NP.concatenate([[0.0], super_diagonal[:-1]]), diagonal, NP.concatenate([sub_diagonal[1:], [0.0]])]);
+            interior = scipy.linalg.solve_banded((1, 1), banded, right_hand_side, check_finite=False);
+        elif early_exercise == 'Brennan-Schwartz':
+            if is_call: # the exercise region is at the top of the grid, so the grid is reversed
+                sub_diagonal, diagonal, super_diagonal = super_diagonal[::-1], diagonal[::-1], sub_diagonal[::-1];
+            if step not in factors:
+                factors[step] = _Brennan_Schwartz_factors(sub_diagonal, diagonal, super_diagonal);
+            if is_call:
+                interior = _Brennan_Schwartz(sub_diagonal, *factors[step], right_hand_side[::-1], exercise_values[-2:0:-1])[::-1];
+            else:
+                interior = _Brennan_Schwartz(sub_diagonal, *factors[step], right_hand_side, exercise_values[1:-1]);
+        else:
+            interior = _PSOR(sub_diagonal, diagonal, super_diagonal, right_hand_side, exercise_values[1:-1], previous[1:-1]);
+        grid[n, 0], grid[n, 1:-1], grid[n, -1] = low, interior, high;
+    return NP.moveaxis(grid, 2, 0);
+
+def Finite_difference_price(option, spot_steps, time_steps, volatility, discount_rate, initial_underlying_price, dividend_yield,
+                            early_exercise='Brennan-Schwartz', maximum_price=None):
+    """
+    Prices an option, or every option of an Option_book with the same expiry (any mix of types, styles and strikes), on a
+    finite-difference grid.
+    'spot_steps': the number of intervals of the underlying price grid, from 0 to 'maximum_price'
+    'time_steps': the number of time steps from expiry to today
+    'early_exercise': one of EARLY_EXERCISE_METHODS, for American options
+    'maximum_price': the top of the grid; by default the larger of the highest strike and the underlying price, times
+        max(2, e^(4σ√T)). The grid is adjusted so that 'initial_underlying_price' falls on a node.
+    The other arguments are as in Binomial_price_with_volatility(). Returns a dictionary of unrounded results:
+    "Option value", "Delta", "Gamma", "Theta": at the initial underlying price, with theta per year as in BSM_theta()
+    "Underlying prices", "Times to expiry": the axes of the grid (times from 0 at expiry up to the option's expiry today)
+    "Value grid": the value at every time and underlying price
+    "Delta grid", "Gamma grid", "Theta grid": today's Greeks at every underlying price (NaN at the ends of the grid)
+    For a single option the results are scalars and arrays; for a book each has an extra first axis with one entry per option.
+    """
+    if early_exercise not in EARLY_EXERCISE_METHODS:
+        raise ValueError("Invalid early exercise method. Expected one of: %s" % EARLY_EXERCISE_METHODS);
+    book = option if isinstance(option, PaP.Option_book) else PaP.Option_book.from_options([option]);
+    if len(book) == 0 or (book.time_to_expiry != book.time_to_expiry[0]).any():
+        raise ValueError("Finite-difference pricing needs options with the same expiry!");
+    if time_steps < 4:
+        raise ValueError("Finite-difference pricing needs at least 4 time steps!");
+    T = float(book.time_to_expiry[0]);
+    S0 = initial_underlying_price;
+
+    # The underlying price grid, with S0 on a node:
+    if maximum_price is None:
+        maximum_price = max(book.strike_price.max(), S0)*max(2.0, math.e**(4*volatility*math.sqrt(T)));
+    S0_node = min(max(int(round(spot_steps*S0/maximum_price)), 1), spot_steps-1);
+    underlying_prices = NP.arange(spot_steps+1)*(S0/S0_node);
+    # The time levels: four implicit half steps, then full Crank-Nicolson steps
+    step = T/time_steps;
+    time_levels = NP.concatenate([NP.arange(RANNACHER_STEPS+1)*step/2, NP.arange(RANNACHER_STEPS//2 + 1, time_steps+1)*step]);
+
+    grid = NP.empty((len(book), len(time_levels), len(underlying_prices)));
+    for is_call in (True, False):
+        for is_american in (False, True):
+            members = NP.flatnonzero((book.is_call == is_call) & (book.is_american == is_american));
+            if len(members):
+                grid[members] = _solve_group(is_call, is_american, book.strike_price[members], underlying_prices, time_levels,
+                                             volatility, discount_rate, dividend_yield, early_exercise);
+
+    # Greeks by central differences on today's level of the grid, and theta by a second order backward difference in time:
+    today = grid[:, -1];
+    spot_step = underlying_prices[1];
+    delta_grid = NP.full_like(today, NP.nan);
+    gamma_grid = NP.full_like(today, NP.nan);
+    delta_grid[:, 1:-1] = (today[:, 2:] - today[:, :-2])/(2*spot_step);
+    gamma_grid[:, 1:-1] = (today[:, 2:] - 2*today[:, 1:-1] + today[:, :-2])/spot_step**2;
+    theta_grid = -(3*grid[:, -1] - 4*grid[:, -2] + grid[:, -3])/(2*step);
+    results = {
+        "Option value": today[:, S0_node],
+        "Delta": delta_grid[:, S0_node],
+        "Gamma": gamma_grid[:, S0_node],
+        "Theta": theta_grid[:, S0_node],
+        "Underlying prices": underlying_prices,
+        "Times to expiry": time_levels,
+        "Value grid": grid,
+        "Delta grid": delta_grid,
+        "Gamma grid": gamma_grid,
+        "Theta grid": theta_grid
+    };
+    if not isinstance(option, PaP.Option_book):
+        results = {name: (values if name in ("Underlying prices", "Times to expiry") else
+                          values[0].item() if values.ndim == 1 else values[0]) for name, values in results.items()};
+    return results;
@@ -0,0 +1,144 @@
+"""
+Opt-in instrumentation of the pricing and risk functions: call counts, cumulative wall time, solver iterations, lattice sizes
+and memory, and price history cache hits.
+Nothing is measured unless collection is switched on, and switching it off leaves the functions exactly as they were: the
+instrumented functions are replaced by timing wrappers in their modules only while collecting (calls between functions of the
+same module go through the module's namespace, so they are counted as well), and the few measurements taken inside functions
+are guarded by a single module-level check.
+Example:
+    with Instrumentation.Collect() as metrics:
+        PaP.Option_Stats(option, 100, 0.05, 0.2, 0);
+    print(metrics.as_dict());
+    print(metrics.to_prometheus());
+"""
+import functools;
+import re;
+import threading;
+import time;
+import Products_and_Pricing as PaP;
+import Risk_Metrics as RM;
+
+# The functions instrumented in each module:
+INSTRUMENTED_FUNCTIONS = {
+    PaP: ['phi', 'Binomial_price', 'Binomial_price_with_volatility', '_European_lattice', '_American_lattice', '_trinomial_lattice',
+          'Lattice_price', 'BSM_price', 'BSM_warrant_price', 'BSM_price_batch', 'BSM_warrant_price_batch', 'BSM_book_price',
+          'BSM_implied_volatility', 'BSM_implied_volatility_batch', 'BSM_delta', 'BSM_gamma', 'BSM_vega', 'BSM_theta', 'BSM_rho',
+          'BSM_greeks', 'Option_Stats', 'Lattice_Option_Stats'],
+    RM: ['Load_price_history', '_read_price_csv', 'Stats_on_csv', 'Portfolio_VaR', 'Binomial_VaR_backtesting',
+         'VaR_backtesting_batch', 'EWMA_volatility', 'EWMA_volatility_series']
+};
+
+class Metrics:
+    """
+    The measurements of one collection: for each function the number of calls and the cumulative wall time (including the
+    time spent in the functions it calls), and for each named quantity (e.g. solver iterations) its count, sum and maximum.
+    It is safe to update from several threads.
+    """
+    def __init__(self):
+        self.calls = {};
+        self.seconds = {};
+        self.observations = {}; # name: [count, sum, maximum]
+        self._lock = threading.Lock();
+
+    def record_call(self, name, seconds):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1;
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds;
+
+    def observe(self, name, value):
+        """
+        Records one value of a named quantity, e.g. the number of iterations of one solver call.
+        """
+        with self._lock:
+            observation = self.observations.setdefault(name, [0, 0.0, value]);
+            observation[0] += 1;
+            observation[1] += value;
+            observation[2] = max(observation[2], value);
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "Calls": dict(self.calls),
+                "Seconds": dict(self.seconds),
+                "Observations": {name: {"Count": count, "Sum": total, "Max": maximum}
+                                 for name, (count, total, maximum) in self.observations.items()}
+            };
+
+    def to_prometheus(self, prefix='finance'):
+        """
+        The measurements in the Prometheus text exposition format.
+        """
+        def label(value):
+            return value.replace('\\', '\\\\').replace('"', '\\"');
+        lines = [];
+        with self._lock:
+            lines.append("# HELP %s_calls_total Number of calls of each function." % prefix);
+            lines.append("# TYPE %s_calls_total counter" % prefix);
+            lines += ['%s_calls_total{function="%s"} %d' % (prefix, label(name), count) for name, count in sorted(self.calls.items())];
+            lines.append("# HELP %s_seconds_total Cumulative wall time of each function." % prefix);
+            lines.append("# TYPE %s_seconds_total counter" % prefix);
+            lines += ['%s_seconds_total{function="%s"} %.9f' % (prefix, label(name), seconds) for name, seconds in sorted(self.seconds.items())];
+            for name, (count, total, maximum) in sorted(self.observations.items()):
+                metric = prefix + '_' + re.sub(r'[^a-zA-Z0-9_]', '_', name).lower();
+                lines.append("# TYPE %s summary" % metric);
+                lines.append("%s_count %d" % (metric, count));
+                lines.append("%s_sum %s" % (metric, repr(float(total))));
+                lines.append("# TYPE %s_max gauge" % metric);
+                lines.append("%s_max %s" % (metric, repr(float(maximum))));
+        return '\n'.join(lines) + '\n';
+
+_active_metrics = None;
+_original_functions = {};
+
+def _timed(name, function, metrics):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter();
+        try:
+            return function(*args, **kwargs);
+        finally:
+            metrics.record_call(name, time.perf_counter() - start);
+    return wrapper;
+
+def Enable(metrics=None):
+    """
+    Starts collecting into 'metrics' (a new Metrics object if not given) and returns it.
+    Only one collection can be active at a time.
+    """
+    global _active_metrics;
+    if _active_metrics is not None:
+        raise RuntimeError("Instrumentation is already enabled!");
+    metrics = metrics if metrics is not None else Metrics();
+    for module, names in INSTRUMENTED_FUNCTIONS.items():
+        for name in names:
+            original = getattr(module, name);
+            _original_functions[(module, name)] = original;
+            setattr(module, name, _timed(name, original, metrics));
+        module._instrumentation = metrics; # turns on the measurements inside the functions
+    _active_metrics = metrics;
+    return metrics;
+
+def Disable():
+    """
+    Stops collecting and puts the original functions back.
+    """
+    global _active_metrics;
+    for (module, name), original in _original_functions.items():
+        setattr(module, name, original);
+    for module in INSTRUMENTED_FUNCTIONS:
+        module._instrumentation = None;
+    _original_functions.clear();
+    _active_metrics = None;
+
+class Collect:
+    """
+    Context manager that collects metrics within its scope and returns the Metrics object.
+    """
+    def __init__(self, metrics=None):
+        self.metrics = metrics;
+    def __enter__(self):
+        self.metrics = Enable(self.metrics);
+        return self.metrics;
+    def __exit__(self, exc_type, exc_value, traceback):
+        Disable();
+        return False;
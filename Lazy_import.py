@@ -0,0 +1,39 @@
+import importlib;
+import importlib.util;
+import sys;
+import threading;
+import types;
+
+_load_lock = threading.RLock(); # re-entrant, since loading one module may load another lazily imported one
+
+class _Lazy_module(types.ModuleType):
+    """
+    Stands in for a module until one of its attributes is used, then imports the real module and takes on its contents.
+    The first load is done under _load_lock, so threads that use the module at the same time all wait for the complete
+    module instead of seeing a half-executed one (which importlib.util.LazyLoader does not guarantee).
+    """
+    def __getattr__(self, attribute): # only called for attributes not yet copied from the real module
+        with _load_lock:
+            module = importlib.import_module(self.__name__);
+            if not self.__dict__.get('_Lazy_module_loaded', False):
+                self.__dict__.update(module.__dict__);
+                self.__dict__['_Lazy_module_loaded'] = True;
+        return getattr(module, attribute);
+
+def Lazy_import(name):
+    """
+    Returns the module 'name' without executing it yet: the module is loaded the first time one of its attributes is used.
+    It is used for the heavy dependencies (pandas, scipy submodules) so that importing this library stays fast for callers
+    that never need them. If the module is already imported, it is returned as it is. Loading is thread-safe.
+    For a submodule such as 'scipy.stats', the parent package is imported normally and the submodule is set as its attribute
+    (until it is loaded), so code written as scipy.stats.norm.ppf() keeps working.
+    """
+    if name in sys.modules:
+        return sys.modules[name];
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError("No module named '%s'" % name, name=name);
+    module = _Lazy_module(name);
+    if '.' in name:
+        parent, child = name.rsplit('.', 1);
+        setattr(sys.modules[parent], child, module);
+    return module;
@@ -0,0 +1,181 @@
+import math;
+import os;
+from concurrent.futures import ProcessPoolExecutor;
+import numpy as NP;
+import Products_and_Pricing as PaP; # for the product classes and the analytic BSM price used as control variate
+
+class European_payoff:
+    """
+    Payoff at expiry of an option, forward or future, given the simulated paths (one row per path, one column per time step).
+    It is a module-level class, rather than a lambda, so that it can be sent to the worker processes.
+    """
+    def __init__(self, instrument):
+        self.instrument = instrument;
+    def __call__(self, paths):
+        final_prices = paths[:,-1];
+        if isinstance(self.instrument, PaP.Option):
+            if self.instrument.option_type == 'call':
+                return NP.maximum(final_prices - self.instrument.strike_price, 0.0);
+            else:
+                return NP.maximum(self.instrument.strike_price - final_prices, 0.0);
+        else:
+            return self.instrument.payoff(final_prices); # Forward.payoff() and Future.payoff() work on arrays as they are
+
+class Asian_payoff:
+    """
+    Payoff of an arithmetic-average (Asian) option: the option's payoff applied to the average underlying price of each path,
+    excluding the initial price.
+    """
+    def __init__(self, option):
+        self.option = option;
+    def __call__(self, paths):
+        average_prices = paths[:,1:].mean(axis=1);
+        if self.option.option_type == 'call':
+            return NP.maximum(average_prices - self.option.strike_price, 0.0);
+        else:
+            return NP.maximum(self.option.strike_price - average_prices, 0.0);
+
+def _simulate_block(block):
+    """
+    Simulates one block of GBM paths and returns the running sums needed for the estimator, so that only six numbers
+    travel back from each worker and the paths themselves are discarded.
+    'block': a tuple of (seed sequence, number of paths, steps, payoff, control payoff, S0, r, q, sigma, T, antithetic)
+    Y is the discounted payoff and X the discounted control payoff (zero if there is no control variate). With antithetic
+    variates each sample is the average of a path and its mirror image, so the standard error stays correct.
+    """
+    seed, block_paths, steps, payoff, control_payoff, S0, Rf, q, sigma, T, antithetic = block;
+    generator = NP.random.default_rng(seed);
+    step_size = T/steps;
+    drift = (Rf - q - sigma**2/2)*step_size;
+    diffusion = sigma*math.sqrt(step_size);
+    discount = math.e**(-Rf*T);
+
+    shocks = generator.standard_normal((block_paths, steps));
+    samples_Y = NP.zeros(block_paths);
+    samples_X = NP.zeros(block_paths);
+    for sign in ((1.0, -1.0) if antithetic else (1.0,)):
+        log_paths = NP.cumsum(drift + sign*diffusion*shocks, axis=1);
+        paths = S0 * NP.exp(NP.hstack((NP.zeros((block_paths, 1)), log_paths)));
+        samples_Y += payoff(paths)*discount;
+        if control_payoff is not None:
+            samples_X += control_payoff(paths)*discount;
+    if antithetic:
+        samples_Y /= 2;
+        samples_X /= 2;
+    return (block_paths, samples_Y.sum(), (samples_Y**2).sum(), samples_X.sum(), (samples_X**2).sum(), (samples_X*samples_Y).sum());
+
+def _blocks(instrument, underlying_price, risk_free_interest_rate, volatility, dividend_yield, paths, steps, payoff,
+            control_payoff, antithetic, block_size, seed):
+    """
+    Splits the paths of one instrument into blocks for _simulate_block(), each with its own random stream.
+    """
+    block_sizes = [block_size]*(paths//block_size) + ([paths % block_size] if paths % block_size else []);
+    seeds = NP.random.SeedSequence(seed).spawn(len(block_sizes));
+    return [(seeds[i], block_sizes[i], steps, payoff, control_payoff, underlying_price, risk_free_interest_rate, dividend_yield,
+             volatility, instrument.time_to_expiry, antithetic) for i in range(len(block_sizes))];
+
+def _run_blocks(blocks_by_instrument, workers):
+    """
+    Simulates the blocks of several instruments, all in one pool of worker processes, and returns the summed running totals
+    of each instrument.
+    """
+    all_blocks = [block for blocks in blocks_by_instrument for block in blocks];
+    if workers is None:
+        workers = os.cpu_count() or 1;
+    if workers == 1 or len(all_blocks) == 1:
+        block_totals = list(map(_simulate_block, all_blocks));
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            block_totals = list(executor.map(_simulate_block, all_blocks));
+    totals = [];
+    for blocks in blocks_by_instrument:
+        totals.append(NP.sum(block_totals[:len(blocks)], axis=0));
+        block_totals = block_totals[len(blocks):];
+    return totals;
+
+def _estimate(totals, instrument, underlying_price, risk_free_interest_rate, volatility, dividend_yield, use_control):
+    """
+    The price and its standard error from the running totals of an instrument's blocks.
+    """
+    n, sum_Y, sum_Y2, sum_X, sum_X2, sum_XY = totals;
+    mean_Y = sum_Y/n;
+    variance_Y = (sum_Y2 - n*mean_Y**2)/(n-1);
+    if use_control:
+        mean_X = sum_X/n;
+        variance_X = (sum_X2 - n*mean_X**2)/(n-1);
+        covariance = (sum_XY - n*mean_X*mean_Y)/(n-1);
+        beta = covariance/variance_X if variance_X > 0 else 0.0;
+        expected_X = float(PaP.BSM_price_batch(instrument.option_type, instrument.strike_price, instrument.time_to_expiry,
+                                               underlying_price, risk_free_interest_rate, volatility, dividend_yield));
+        price = mean_Y - beta*(mean_X - expected_X);
+        variance = max(variance_Y - beta*covariance, 0.0); # the variance left after the control variate
+    else:
+        price = mean_Y;
+        variance = variance_Y;
+
+    return {
+        "Price": float(price),
+        "Standard error": math.sqrt(variance/n),
+        "Paths": int(n)
+    };
+
+def Monte_Carlo_price(instrument, underlying_price, risk_free_interest_rate, volatility, dividend_yield, paths=100000, steps=1,
+                      payoff=None, antithetic=True, control_variate=True, block_size=50000, workers=None, seed=None):
+    """
+    Monte Carlo price of an option, forward or future under geometric Brownian motion, with its standard error.
+    'instrument': an Option, Forward or Future object; for options, exercise is assumed to be at expiry only
+    'paths': the number of samples (pairs of paths if 'antithetic' is true)
+    'steps': the number of time steps in each path; 1 is enough for payoffs that only depend on the final price
+    'payoff': a function of the paths array (one row per path, columns from t=0 to expiry) returning one payoff per path;
+        it defaults to European_payoff(instrument). It must be picklable (e.g. a module-level function or class) if workers > 1.
+    'antithetic': if true, every normal draw is also used with the opposite sign
+    'control_variate': if true, the instrument is an option and a 'payoff' is given, the option's European payoff is used as a
+        control variate with BSM_price_batch() as the known mean; the coefficient is estimated from the same paths. Without a
+        'payoff' the control would be the payoff itself, which would return the BSM price with no sampling error, so it is
+        not used
+    'block_size': the number of samples simulated at a time; it bounds the memory used by each worker
+    'workers': the number of processes to spread the blocks over; None uses all CPUs and 1 runs in this process.
+        Scripts using more than one worker need the usual "if __name__ == '__main__':" guard on platforms that spawn processes.
+    'seed': seeds the random numbers; every block gets its own stream spawned from it, so results are reproducible
+        regardless of the number of workers
+    For an Option_book the market inputs can also be arrays with one value per option; each option is priced with its own
+    random streams and its European payoff ('payoff' cannot be given), and the values of the result are arrays, NaN for
+    American options. The blocks of all options are spread over one pool of workers.
+    """
+    if paths < 2:
+        print("Function 'Monte_Carlo_price' needs at least 2 paths to estimate the standard error!");
+        return None;
+    if isinstance(instrument, PaP.Option_book):
+        if payoff is not None:
+            print("Function 'Monte_Carlo_price' prices a book with the European payoff of each option; 'payoff' cannot be given!");
+            return None;
+        inputs = NP.broadcast_arrays(*[NP.asarray(x, dtype=float) for x in (underlying_price, risk_free_interest_rate, volatility,
+                                                                            dividend_yield)], NP.empty(len(instrument)))[:-1];
+        seeds = NP.random.SeedSequence(seed).generate_state(len(instrument)); # one seed per option
+        results = {"Price": NP.full(len(instrument), NP.nan), "Standard error": NP.full(len(instrument), NP.nan),
+                   "Paths": NP.zeros(len(instrument), dtype=int)};
+        priced = NP.flatnonzero(~instrument.is_american);
+        options = [instrument[i] for i in priced];
+        market = [[float(x[i]) for x in inputs] for i in priced];
+        blocks = [_blocks(option, *option_market, paths, steps, European_payoff(option), None, antithetic, block_size, int(seeds[i]))
+                  for i, option, option_market in zip(priced, options, market)];
+        for i, option, option_market, totals in zip(priced, options, market, _run_blocks(blocks, workers)):
+            for name, value in _estimate(totals, option, *option_market, False).items():
+                results[name][i] = value;
+        return results;
+    if isinstance(instrument, (PaP.Option, PaP.Forward)) == False:
+        print("Function 'Monte_Carlo_price' can only be used to price options, forwards and futures!");
+        return None;
+    if isinstance(instrument, PaP.Option) and instrument.option_style == 'American':
+        print("Function 'Monte_Carlo_price' only works with European-style exercise!");
+        return None;
+
+    use_control = control_variate and payoff is not None and isinstance(instrument, PaP.Option);
+    if payoff is None:
+        payoff = European_payoff(instrument);
+    control_payoff = European_payoff(instrument) if use_control else None;
+
+    blocks = _blocks(instrument, underlying_price, risk_free_interest_rate, volatility, dividend_yield, paths, steps, payoff,
+                     control_payoff, antithetic, block_size, seed);
+    totals = _run_blocks([blocks], workers)[0];
+    return _estimate(totals, instrument, underlying_price, risk_free_interest_rate, volatility, dividend_yield, use_control);
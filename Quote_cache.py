@@ -0,0 +1,134 @@
+import math;
+import threading;
+import time;
+from collections import OrderedDict;
+import Products_and_Pricing as PaP; # for the pricing functions being cached
+
+class Quote_cache:
+    """
+    Optional memoizing layer over BSM_price(), the Greeks (Option_Stats()) and BSM_implied_volatility(), for callers that
+    reprice the same or nearly the same inputs again and again (e.g. a quoting service or the GUI).
+    Inputs are rounded to the nearest multiple of 'tolerance' before they are used as the key, so inputs that round to the
+    same multiples share an entry and get the result calculated for the first of them; set the tolerance accordingly (0
+    caches exact inputs only). Inputs closer than the tolerance usually share an entry, but not when they fall either side
+    of a halfway point (e.g. 0.49 and 0.51 tolerances); they are then calculated separately, which costs time but not accuracy.
+    'max_entries': the number of results kept; the least recently used are dropped first
+    'ttl': the number of seconds a result stays valid; None keeps it until it is evicted or invalidated
+    All methods are safe to call from several threads. The lock only guards the cache itself: the pricing runs outside it,
+    so concurrent callers are not serialised (two threads missing on the same key at once may both calculate it), and it
+    relies on the pricing functions being thread-safe, including the first load of scipy (see Lazy_import()). A result whose
+    underlying price was invalidated (or the cache cleared) while it was being calculated is returned but not stored.
+    """
+    def __init__(self, tolerance=1e-8, max_entries=10000, ttl=None):
+        self.tolerance = tolerance;
+        self.max_entries = max_entries;
+        self.ttl = ttl;
+        self.hits = 0;
+        self.misses = 0;
+        self._entries = OrderedDict(); # key: (time stored, result), least recently used first
+        self._keys_by_spot = {}; # quantized underlying price: set of keys, for invalidate_underlying()
+        self._generations = {}; # quantized underlying price: number of times it was invalidated
+        self._clears = 0; # number of times the cache was cleared
+        self._lock = threading.Lock();
+
+    def _quantize(self, value):
+        if self.tolerance == 0:
+            return float(value);
+        return math.floor(value/self.tolerance + 0.5);
+
+    def _key(self, function_name, option, underlying_price, *inputs):
+        return (function_name, option.option_type, option.option_style, self._quantize(option.strike_price),
+                self._quantize(option.time_to_expiry), self._quantize(underlying_price)) + tuple(self._quantize(x) for x in inputs);
+
+    def _generation(self, spot):
+        # Changes whenever entries for this quantized underlying price are dropped; only called with the lock held
+        return (self._clears, self._generations.get(spot, 0));
+
+    def _cached(self, key, calculate):
+        with self._lock:
+            entry = self._entries.get(key);
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[0] <= self.ttl):
+                self._entries.move_to_end(key);
+                self.hits += 1;
+                return entry[1];
+            self.misses += 1;
+            generation = self._generation(key[5]);
+        result = calculate();
+        with self._lock:
+            if self._generation(key[5]) != generation: # invalidated while calculating, so the result may be stale
+                return result;
+            self._entries[key] = (time.monotonic(), result);
+            self._entries.move_to_end(key);
+            self._keys_by_spot.setdefault(key[5], set()).add(key);
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)));
+        return result;
+
+    def _remove(self, key):
+        # Only called with the lock held
+        del self._entries[key];
+        keys = self._keys_by_spot.get(key[5]);
+        if keys is not None:
+            keys.discard(key);
+            if not keys:
+                del self._keys_by_spot[key[5]];
+
+    def price(self, option, underlying_price, risk_free_interest_rate, volatility, dividend_yield):
+        """
+        Cached BSM_price().
+        """
+        key = self._key('price', option, underlying_price, risk_free_interest_rate, volatility, dividend_yield);
+        return self._cached(key, lambda: PaP.BSM_price(option, underlying_price, risk_free_interest_rate, volatility, dividend_yield));
+
+    def greeks(self, option, underlying_price, risk_free_interest_rate, volatility, dividend_yield):
+        """
+        Cached Option_Stats(): the price and all Greeks. A copy is returned, so the cached result cannot be changed by the caller.
+        """
+        key = self._key('greeks', option, underlying_price, risk_free_interest_rate, volatility, dividend_yield);
+        stats = self._cached(key, lambda: PaP.Option_Stats(option, underlying_price, risk_free_interest_rate, volatility, dividend_yield));
+        return dict(stats) if stats is not None else None;
+
+    def implied_volatility(self, option, option_price, underlying_price, risk_free_interest_rate, dividend_yield):
+        """
+        Cached BSM_implied_volatility().
+        """
+        key = self._key('implied volatility', option, underlying_price, option_price, risk_free_interest_rate, dividend_yield);
+        return self._cached(key, lambda: PaP.BSM_implied_volatility(option, option_price, underlying_price, risk_free_interest_rate,
+                                                                     dividend_yield));
+
+    def invalidate_underlying(self, underlying_price):
+        """
+        Drops every entry calculated for this underlying price (within the tolerance), e.g. when the spot is known to be stale.
+        As a price within the tolerance can round to a neighbouring multiple of it, the entries of both neighbouring
+        multiples are dropped too, so entries up to 1.5 tolerances away can go. Calculations of these prices that are still
+        running will not be stored. Returns the number of entries dropped.
+        """
+        spot = self._quantize(underlying_price);
+        spots = [spot] if self.tolerance == 0 else [spot - 1, spot, spot + 1];
+        with self._lock:
+            keys = [key for bucket in spots for key in self._keys_by_spot.get(bucket, ())];
+            for key in keys:
+                self._remove(key);
+            for bucket in spots:
+                self._generations[bucket] = self._generations.get(bucket, 0) + 1;
+        return len(keys);
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear();
+            self._keys_by_spot.clear();
+            self._generations.clear();
+            self._clears += 1;
+
+    def stats(self):
+        """
+        The hit and miss counts, the hit rate and the number of entries.
+        """
+        with self._lock:
+            requests = self.hits + self.misses;
+            return {
+                "Hits": self.hits,
+                "Misses": self.misses,
+                "Hit rate": self.hits/requests if requests else 0.0,
+                "Entries": len(self._entries)
+            };
@@ -1,17 +1,164 @@
-import pandas as PD;
 import numpy as NP;
 import math;
-import scipy.stats;
-import matplotlib.pyplot as plt;
+import bisect;
+import itertools;
+import os;
+import json;
+import shutil;
+import hashlib;
+import tempfile;
+from concurrent.futures import ThreadPoolExecutor;
+from Lazy_import import Lazy_import;
+# The heavy dependencies are only loaded when first used; matplotlib is imported by Stats_on_csv() only when it plots:
+PD = Lazy_import('pandas');
+scipy = Lazy_import('scipy');
+Lazy_import('scipy.stats');
+Lazy_import('scipy.signal');
+Lazy_import('scipy.special');
 
-def Stats_on_csv(input_file, lookback_period, holding_period, confidence_level, business_days=252, save_file=True):
+_instrumentation = None; # set by Instrumentation.Enable() to a Metrics object while metrics are collected
+
+#################### Price history loading and cache ####################
+# The parsed contents of each csv file are cached in binary form, so that the text is parsed only once.
+# Each entry is a folder with the float columns as one memory-mapped .npy array, the other numeric columns and the dates as
+# separate .npy arrays, and a json file describing the columns. Entries are keyed by the file's path, size and modification
+# time (and by the column types requested), so an edited file is parsed again.
+# The cache is off by default, since it writes to disk: call Configure_price_cache(enabled=True) to use it (optionally with
+# a directory of your own instead of the system's temporary folder), and Clear_price_cache() to remove its files.
+PRICE_CACHE_ENABLED = False;
+PRICE_CACHE_DIRECTORY = os.path.join(tempfile.gettempdir(), 'Finance_in_Python_price_cache');
+PRICE_CACHE_MAX_BYTES = 2**30; # total size of the cache; least recently used entries are removed above it
+
+def Configure_price_cache(enabled=None, directory=None, max_bytes=None):
+    """
+    Changes the price history cache settings; arguments left as None are not changed.
+    'enabled': set to True to cache the parsed csv files, or False (the default) to always parse them
+    'directory': where the cache entries are stored
+    'max_bytes': the total size of the cache, above which the least recently used entries are removed
+    """
+    global PRICE_CACHE_ENABLED, PRICE_CACHE_DIRECTORY, PRICE_CACHE_MAX_BYTES;
+    if enabled is not None:
+        PRICE_CACHE_ENABLED = enabled;
+    if directory is not None:
+        PRICE_CACHE_DIRECTORY = directory;
+    if max_bytes is not None:
+        PRICE_CACHE_MAX_BYTES = max_bytes;
+
+def Clear_price_cache():
+    """
+    Removes all entries from the price history cache.
+    """
+    shutil.rmtree(PRICE_CACHE_DIRECTORY, ignore_errors=True);
+
+def _read_price_csv(input_file, dtype_dict):
+    return PD.read_csv(input_file, header=0, index_col=0, parse_dates=True, dtype=dtype_dict, thousands=',');
+
+def _price_cache_key(input_file, dtype_dict):
+    file_stats = os.stat(input_file);
+    key = json.dumps([os.path.abspath(input_file), file_stats.st_size, file_stats.st_mtime_ns, sorted(dtype_dict.items())]);
+    return hashlib.sha1(key.encode()).hexdigest();
+
+def _write_price_cache_entry(entry_folder, data):
+    """
+    Writes a parsed DataFrame to a cache entry. Returns False if the data cannot be stored in binary form.
+    """
+    if not isinstance(data.index, PD.DatetimeIndex) or data.index.tz is not None:
+        return False;
+    float_columns = [column for column in data.columns if data[column].dtype == NP.float64];
+    other_columns = [column for column in data.columns if column not in float_columns];
+    if any(data[column].dtype.kind not in 'iufb' for column in other_columns):
+        return False; # text columns are not cached
+    # Written to a temporary folder first and then renamed, so a half-written entry is never read:
+    os.makedirs(PRICE_CACHE_DIRECTORY, exist_ok=True);
+    temporary_folder = tempfile.mkdtemp(dir=PRICE_CACHE_DIRECTORY);
+    # The float columns are stored transposed (one row per column), the layout pandas uses internally:
+    NP.save(os.path.join(temporary_folder, 'floats.npy'), NP.ascontiguousarray(data[float_columns].to_numpy().T));
+    NP.save(os.path.join(temporary_folder, 'dates.npy'), data.index.to_numpy());
+    for i, column in enumerate(other_columns):
+        NP.save(os.path.join(temporary_folder, 'column_%d.npy' % i), data[column].to_numpy());
+    with open(os.path.join(temporary_folder, 'columns.json'), 'w') as description:
+        json.dump({"columns": list(data.columns), "float columns": float_columns, "other columns": other_columns,
+                   "index name": data.index.name}, description);
+    try:
+        os.rename(temporary_folder, entry_folder);
+    except OSError: # another process wrote the same entry in the meantime
+        shutil.rmtree(temporary_folder, ignore_errors=True);
+    return True;
+
+def _read_price_cache_entry(entry_folder):
+    """
+    Loads a cache entry; the arrays are memory-mapped, so the float columns are not copied.
+    """
+    with open(os.path.join(entry_folder, 'columns.json')) as description:
+        columns = json.load(description);
+    floats = NP.load(os.path.join(entry_folder, 'floats.npy'), mmap_mode='r');
+    dates = PD.DatetimeIndex(NP.load(os.path.join(entry_folder, 'dates.npy'), mmap_mode='r'), name=columns["index name"]);
+    data = PD.DataFrame(floats.T, index=dates, columns=columns["float columns"], copy=False);
+    for i, column in enumerate(columns["other columns"]):
+        data[column] = NP.load(os.path.join(entry_folder, 'column_%d.npy' % i), mmap_mode='r');
+    os.utime(os.path.join(entry_folder, 'columns.json')); # marks the entry as recently used
+    return data[columns["columns"]];
+
+def _evict_price_cache():
+    """
+    Removes the least recently used entries until the cache fits in PRICE_CACHE_MAX_BYTES.
+    """
+    entries = [];
+    for name in os.listdir(PRICE_CACHE_DIRECTORY):
+        folder = os.path.join(PRICE_CACHE_DIRECTORY, name);
+        try:
+            last_used = os.path.getmtime(os.path.join(folder, 'columns.json'));
+            size = sum(os.path.getsize(os.path.join(folder, file)) for file in os.listdir(folder));
+        except OSError: # temporary folders still being written, or entries removed by another process
+            continue;
+        entries.append((last_used, size, folder));
+    total_bytes = sum(entry[1] for entry in entries);
+    for last_used, size, folder in sorted(entries):
+        if total_bytes <= PRICE_CACHE_MAX_BYTES:
+            break;
+        shutil.rmtree(folder, ignore_errors=True);
+        total_bytes -= size;
+
+def Load_price_history(input_file, dtype_dict):
+    """
+    Loads a csv file retrieved from Yahoo! Finance into a DataFrame indexed by date, as PD.read_csv() would with the given
+    column types. If the price cache is enabled (see Configure_price_cache()), the parsed data is cached, so later calls on
+    the same, unchanged file reload the binary copy instead of parsing the text again. Data loaded from the cache is
+    read-only: add new columns rather than modifying the existing ones in place.
+    """
+    if not PRICE_CACHE_ENABLED:
+        return _read_price_csv(input_file, dtype_dict);
+    entry_folder = os.path.join(PRICE_CACHE_DIRECTORY, _price_cache_key(input_file, dtype_dict));
+    if os.path.isdir(entry_folder):
+        try:
+            data = _read_price_cache_entry(entry_folder);
+            if _instrumentation is not None:
+                _instrumentation.observe('Price cache hits', 1);
+            return data;
+        except (OSError, ValueError, KeyError): # damaged entry; parse the file again
+            shutil.rmtree(entry_folder, ignore_errors=True);
+    if _instrumentation is not None:
+        _instrumentation.observe('Price cache misses', 1);
+    data = _read_price_csv(input_file, dtype_dict);
+    if _write_price_cache_entry(entry_folder, data):
+        _evict_price_cache();
+    return data;
+
+#################### Risk metrics ####################
+def Stats_on_csv(input_file, lookback_period, holding_period, confidence_level, business_days=252, save_file=True,
+                 horizon='overlapping', plot=True):
     """
     It calculates Value-at-Risk at the given confidence level for given look-back and holding periods.
     Look-back period is in years and holding_period is in days. It assumes 252 business days in a year.
     The input file is in csv format retrieved from Yahoo! Finance. Column format:
     Date | Open | High | Low | Close | Adj. close | Volume
     VaR is given in % calculated on the worst log returns in the holding period.
+    'horizon': how the holding period is applied:
+        'overlapping': for every day, the worst log return over the 1 to holding_period days before it
+        'non-overlapping': the same worst log returns, but only for every holding_period-th day, so that the windows do not overlap
+        'sqrt-of-time': 1-day log returns, with VaR, ES and volatility scaled by the square root of the holding period
     If save_file is true, it saves a copy of the data frame as csv file.
+    If plot is true, it plots the log returns and VaR with matplotlib; set it to False for runs without a display.
     """
     #################### Input checks ####################
     if (type(input_file) != str):
@@ -26,8 +173,13 @@ def Stats_on_csv(input_file, lookback_period, holding_period, confidence_level,
         print("The business days number must be an integer!");
         return None;
     
-    if (holding_period > 10 or holding_period < 1): # arbitrary ceiling of 10 days
-        print("The holding period must be between 1 and 10 days!");
+    if (holding_period < 1 or holding_period >= lookback_period*business_days):
+        print("The holding period must be at least 1 day and shorter than the look-back period!");
+        return None;
+
+    horizons = ['overlapping', 'non-overlapping', 'sqrt-of-time'];
+    if horizon not in horizons:
+        print("Invalid horizon. Expected one of: %s" % horizons);
         return None;
     
     if (business_days > 253 or business_days < 250):
@@ -47,7 +199,7 @@ def Stats_on_csv(input_file, lookback_period, holding_period, confidence_level,
     'Close': 'float',
     'Adj. close': 'float'
     };
-    price_data = PD.read_csv(input_file, header=0, index_col=0, parse_dates=True, dtype=dtype_dict, thousands=',');
+    price_data = Load_price_history(input_file, dtype_dict);
     
     # Making sure there is enough data to work with:
     if (lookback_period*business_days > price_data['Adj. close'].size):
@@ -56,29 +208,32 @@ def Stats_on_csv(input_file, lookback_period, holding_period, confidence_level,
     else:
         price_data = price_data.head(lookback_period*business_days); # only keeps data within the look-back period
     
-    # Creates a new column for log returns and populates it with the 1-day log returns:
-    price_data['Log return'] = NP.log(price_data['Adj. close'] / price_data['Adj. close'].shift(-1));
-    
-    # If holding period longer than 1 day, calculate their log returns and replace in the 'Log return' column if lower:
-    if (holding_period > 1):
-        for i in range(2, holding_period+1):
-            price_data['temp log return'] = NP.log(price_data['Adj. close'] / price_data['Adj. close'].shift(-i));
-            price_data['Log return'] = price_data[['Log return', 'temp log return']].min(axis=1);
-            price_data.drop('temp log return', axis=1);
+    # Creates a new column for log returns and populates it with the worst log return over the holding period.
+    # The rows are in reverse date order, so the return over the i days before row t is ln(P(t)/P(t+i)) and the worst one
+    # is ln(P(t)) - max(ln(P(t+1)), ..., ln(P(t+h))). The maximum is a rolling window over the log prices, so it costs the
+    # same for any holding period (near the start of the data the window is shorter, as fewer earlier prices exist):
+    window = 1 if horizon == 'sqrt-of-time' else holding_period;
+    log_prices = NP.log(price_data['Adj. close'].to_numpy());
+    earlier_log_prices = PD.Series(log_prices[::-1]).rolling(window, min_periods=1).max().shift(1).to_numpy()[::-1];
+    price_data['Log return'] = log_prices - earlier_log_prices;
+    if horizon == 'non-overlapping':
+        price_data = price_data.iloc[::holding_period];
     
     # Cleanup:
-    price_data.dropna(); # removes any rows with NaN
-    price_data.drop('temp log return');
+    price_data = price_data.dropna(subset=['Log return']); # removes the rows without a log return (NaN in the price used)
     
-    VaR = -price_data['Log return'].quantile(1-confidence_level, interpolation='nearest');
-    ES = -NP.average(price_data['Log return'][price_data['Log return'] < price_data['Log return'].quantile(1-confidence_level)]);
-    volatility = price_data['Log return'].std()*math.sqrt(lookback_period); # annualised volatility
+    scaling = math.sqrt(holding_period) if horizon == 'sqrt-of-time' else 1;
+    VaR = -price_data['Log return'].quantile(1-confidence_level, interpolation='nearest')*scaling;
+    ES = -NP.average(price_data['Log return'][price_data['Log return'] < price_data['Log return'].quantile(1-confidence_level)])*scaling;
+    volatility = price_data['Log return'].std()*math.sqrt(lookback_period)*scaling; # annualised volatility
     # Volatility above is calculated with the simple variance method, thus all observations have the same weight.
     
     # Visualisation:
-    price_data['Log return'].plot(figsize=(12,6), ls="-", color="blue", label="Daily log returns", legend=True);
-    plt.hlines(y=-VaR, xmin=price_data.index[0], xmax=price_data.index[len(price_data.index)-1], color='r', linestyle='-', label='VaR');
-    plt.legend();
+    if plot:
+        import matplotlib.pyplot as plt; # only imported when needed
+        price_data['Log return'].plot(figsize=(12,6), ls="-", color="blue", label="Daily log returns", legend=True);
+        plt.hlines(y=-VaR, xmin=price_data.index[0], xmax=price_data.index[len(price_data.index)-1], color='r', linestyle='-', label='VaR');
+        plt.legend();
 
     if save_file:
         price_data.to_csv('log_returns_' + input_file);
@@ -89,6 +244,111 @@ def Stats_on_csv(input_file, lookback_period, holding_period, confidence_level,
         "Volatility": round(volatility,4)
     };
 
+def _load_adjusted_close(input_file):
+    """
+    Loads the 'Adj. close' column of one csv file, for Portfolio_VaR().
+    """
+    dtype_dict = { # dictates how the data will be interpreted
+    'Open': 'float',
+    'High': 'float',
+    'Low': 'float',
+    'Close': 'float',
+    'Adj. close': 'float'
+    };
+    return Load_price_history(input_file, dtype_dict)['Adj. close'];
+
+def Portfolio_VaR(input_files, weights, lookback_period, confidence_level, business_days=252, workers=None):
+    """
+    It calculates 1-day Value-at-Risk and expected shortfall at the given confidence level for a portfolio of assets.
+    'input_files': a folder (all its .csv files are used) or a list of csv files in the format of Stats_on_csv(); each asset
+        is named after its file name without the extension
+    'weights': the portfolio weight of each asset (fraction of the portfolio's value), either as a dictionary keyed by asset
+        name or as a list in the same order as the files (alphabetical for a folder)
+    'workers': the number of threads loading the files in parallel; None lets the pool decide
+    The files are loaded in parallel and aligned on the dates where all of them have a price; the most recent lookback_period*business_days
+    log returns form a return matrix (one column per asset) from which everything is calculated:
+    - historical simulation: VaR and ES from the portfolio returns, as in Stats_on_csv()
+    - parametric: VaR = z*σp - μp and ES = σp*pdf(z)/(1-c) - μp, with σp^2 = w'Σw from the covariance matrix Σ
+    - marginal VaR of each asset, z*(Σw)i/σp - μi, and its component VaR, the weight times the marginal VaR; the component VaRs
+      add up to the parametric VaR
+    - historical component VaR: each asset's contribution to the portfolio loss in the scenario at the historical VaR quantile
+    VaR and ES are given in % of the portfolio value, as positive numbers.
+    """
+    #################### Input checks ####################
+    if isinstance(input_files, str):
+        if not os.path.isdir(input_files):
+            print("The input folder does not exist!");
+            return None;
+        input_files = sorted(os.path.join(input_files, name) for name in os.listdir(input_files) if name.lower().endswith('.csv'));
+    if len(input_files) == 0:
+        print("There are no input files!");
+        return None;
+
+    asset_names = [os.path.splitext(os.path.basename(input_file))[0] for input_file in input_files];
+    if isinstance(weights, dict):
+        if set(weights) != set(asset_names):
+            print("The weights must be given for exactly the assets in the input files!");
+            return None;
+        weights = [weights[name] for name in asset_names];
+    if len(weights) != len(input_files):
+        print("There must be one weight for each input file!");
+        return None;
+
+    if (confidence_level > 1 or confidence_level <= 0):
+        print("The confidence level must be less than 1 and more than 0!");
+        return None;
+    #################### End of input checks ####################
+
+    # Loads the files in parallel and aligns them on their common dates:
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        prices = list(executor.map(_load_adjusted_close, input_files));
+    price_matrix = PD.concat(prices, axis=1, join='inner', keys=asset_names).sort_index();
+    price_matrix = price_matrix.dropna(); # removes the dates where any asset has no price
+    if (price_matrix.to_numpy() <= 0).any():
+        print("All prices must be positive to calculate log returns!");
+        return None;
+
+    # Making sure there is enough data to work with:
+    observations = int(lookback_period*business_days);
+    if (observations >= len(price_matrix.index)):
+        print("Not enough common data points to calculate %d-year VaR!" % (lookback_period));
+        return None;
+
+    # The return matrix, one row per day and one column per asset:
+    log_prices = NP.log(price_matrix.to_numpy()[-(observations+1):]);
+    returns = log_prices[1:] - log_prices[:-1];
+    weights = NP.asarray(weights, dtype=float);
+    portfolio_returns = returns @ weights;
+
+    # Historical simulation:
+    historical_VaR = -NP.quantile(portfolio_returns, 1-confidence_level, method='nearest');
+    historical_ES = -NP.average(portfolio_returns[portfolio_returns < NP.quantile(portfolio_returns, 1-confidence_level)]);
+    scenario = NP.flatnonzero(portfolio_returns == -historical_VaR)[0]; # the day at the VaR quantile
+    historical_components = -weights*returns[scenario];
+
+    # Parametric (variance-covariance):
+    mean_returns = returns.mean(axis=0);
+    covariance = NP.cov(returns, rowvar=False).reshape(len(weights), len(weights));
+    portfolio_mean = weights @ mean_returns;
+    portfolio_volatility = math.sqrt(weights @ covariance @ weights);
+    z = scipy.stats.norm.ppf(confidence_level);
+    parametric_VaR = z*portfolio_volatility - portfolio_mean;
+    parametric_ES = portfolio_volatility*scipy.stats.norm.pdf(z)/(1-confidence_level) - portfolio_mean;
+    marginal_VaR = z*(covariance @ weights)/portfolio_volatility - mean_returns;
+
+    return {
+        "Assets": len(asset_names),
+        "Observations": observations,
+        "Historical VaR": round(historical_VaR,4),
+        "Historical expected shortfall": round(historical_ES,4),
+        "Parametric VaR": round(parametric_VaR,4),
+        "Parametric expected shortfall": round(parametric_ES,4),
+        "Volatility": round(portfolio_volatility,4), # daily volatility of the portfolio's returns
+        "Marginal VaR": PD.Series(marginal_VaR, index=asset_names).round(4),
+        "Component VaR": PD.Series(weights*marginal_VaR, index=asset_names).round(4),
+        "Historical component VaR": PD.Series(historical_components, index=asset_names).round(4)
+    };
+
 def Binomial_VaR_backtesting(input_file, VaR, VaR_level, confidence_level):
     """
     It performs dirty backtesting on a VaR model. It assumes overshoots are independent and follow the binomial distribution.
@@ -122,7 +382,7 @@ def Binomial_VaR_backtesting(input_file, VaR, VaR_level, confidence_level):
     'Adj. close': 'float',
     'Log return': 'float'
     };
-    return_history = PD.read_csv(input_file, header=0, index_col=0, parse_dates=True, dtype=dtype_dict, thousands=',');
+    return_history = Load_price_history(input_file, dtype_dict);
 
     observations = len(return_history['Log return']); # number of total observations
     overshoots = len(return_history.loc[return_history['Log return']<-VaR]); # number of observations where the log return was exceeding VaR
@@ -150,6 +410,102 @@ def Binomial_VaR_backtesting(input_file, VaR, VaR_level, confidence_level):
         "Non-rejection region": [round(lower_value,4),round(upper_value,4)]
     };
 
+def _log_likelihood(failures, successes, probability):
+    """
+    ln[(1-p)^successes * p^failures], with 0*ln(0) taken as 0.
+    """
+    return scipy.special.xlogy(successes, 1-probability) + scipy.special.xlogy(failures, probability);
+
+def VaR_backtesting_batch(log_returns, VaR_forecasts, VaR_level, confidence_level=0.95):
+    """
+    It backtests many VaR series at once, e.g. every (instrument, VaR level, model) combination, one per column.
+    'log_returns': the realised log returns, a 2-d array or DataFrame with one row per day; a single column is compared with
+        every column of the forecasts
+    'VaR_forecasts': the VaR forecast for each day and series (positive numbers, as given by Stats_on_csv()), same shape
+    'VaR_level': the level of each VaR series, a scalar or one value per column
+    'confidence_level': the confidence level of the tests
+    An exception is a day where the log return is below -VaR; days where the return or the forecast is NaN are skipped.
+    For each series it calculates:
+    - Kupiec's proportion of failures (POF) likelihood ratio, chi-squared with 1 degree of freedom
+    - Christoffersen's independence likelihood ratio, from the transitions between days with and without exceptions (1 d.f.)
+    - the conditional coverage likelihood ratio, the sum of the two above (2 d.f.)
+    - the z-statistic of the normal approximation used by Binomial_VaR_backtesting()
+    - the Basel traffic-light zone: green if the cumulative binomial probability of the number of exceptions is below 95%,
+      yellow if it is below 99.99% and red otherwise (for 250 days at 99%: 0-4 green, 5-9 yellow, 10+ red)
+    It returns a DataFrame with one row per series (labelled with the columns of the forecasts, if it is a DataFrame).
+    """
+    #################### Input checks ####################
+    if (confidence_level > 1 or confidence_level <= 0):
+        print("The confidence level must be less than or equal to 1 and more than 0!");
+        return None;
+    #################### End of input checks ####################
+
+    labels = VaR_forecasts.columns if isinstance(VaR_forecasts, PD.DataFrame) else None;
+    returns = NP.asarray(log_returns, dtype=float);
+    forecasts = NP.asarray(VaR_forecasts, dtype=float);
+    if forecasts.ndim == 1:
+        forecasts = forecasts[:,NP.newaxis];
+    if returns.ndim == 1:
+        returns = returns[:,NP.newaxis];
+    returns, forecasts = NP.broadcast_arrays(returns, forecasts);
+    overshoot_probability = 1 - NP.broadcast_to(NP.asarray(VaR_level, dtype=float), forecasts.shape[1:]);
+    if ((overshoot_probability >= 1) | (overshoot_probability < 0)).any():
+        print("The VaR level must be less than or equal to 1 and more than 0!");
+        return None;
+
+    # Exception indicators, one row per day and one column per series:
+    valid = ~(NP.isnan(returns) | NP.isnan(forecasts));
+    exceptions = valid & (returns < -forecasts);
+    observations = valid.sum(axis=0);
+    overshoots = exceptions.sum(axis=0);
+
+    with NP.errstate(divide='ignore', invalid='ignore'):
+        # Kupiec's proportion of failures test:
+        exception_rate = overshoots / observations;
+        LR_POF = -2*(_log_likelihood(overshoots, observations-overshoots, overshoot_probability)
+                     - _log_likelihood(overshoots, observations-overshoots, exception_rate));
+
+        # Christoffersen's independence test, on consecutive pairs of valid days (n_ij: day with state i followed by state j):
+        pairs = valid[:-1] & valid[1:];
+        n01 = (pairs & ~exceptions[:-1] & exceptions[1:]).sum(axis=0);
+        n11 = (pairs & exceptions[:-1] & exceptions[1:]).sum(axis=0);
+        n00 = (pairs & ~exceptions[:-1] & ~exceptions[1:]).sum(axis=0);
+        n10 = (pairs & exceptions[:-1] & ~exceptions[1:]).sum(axis=0);
+        pi_0 = NP.where(n00+n01 > 0, n01/(n00+n01), 0.0);
+        pi_1 = NP.where(n10+n11 > 0, n11/(n10+n11), 0.0);
+        pi = (n01+n11) / (n00+n01+n10+n11);
+        LR_independence = -2*(_log_likelihood(n01+n11, n00+n10, pi)
+                              - _log_likelihood(n01, n00, pi_0) - _log_likelihood(n11, n10, pi_1));
+        LR_conditional_coverage = LR_POF + LR_independence;
+
+        # Normal approximation to the binomial distribution, as in Binomial_VaR_backtesting():
+        expected_overshoots = observations * overshoot_probability;
+        z_statistic = (overshoots - expected_overshoots) / NP.sqrt(expected_overshoots * (1-overshoot_probability));
+
+    # Basel traffic light:
+    cumulative_probability = scipy.stats.binom.cdf(overshoots, observations, overshoot_probability);
+    zone = NP.where(cumulative_probability < 0.95, 'green', NP.where(cumulative_probability < 0.9999, 'yellow', 'red'));
+
+    significance = 1 - confidence_level;
+    POF_p_value = scipy.stats.chi2.sf(LR_POF, 1);
+    independence_p_value = scipy.stats.chi2.sf(LR_independence, 1);
+    conditional_coverage_p_value = scipy.stats.chi2.sf(LR_conditional_coverage, 2);
+    return PD.DataFrame({
+        "Observations": observations,
+        "Overshoots": overshoots,
+        "Expected overshoots": expected_overshoots,
+        "Exception rate": exception_rate,
+        "Z-statistic": z_statistic,
+        "Kupiec LR": LR_POF,
+        "Kupiec p-value": POF_p_value,
+        "Independence LR": LR_independence,
+        "Independence p-value": independence_p_value,
+        "Conditional coverage LR": LR_conditional_coverage,
+        "Conditional coverage p-value": conditional_coverage_p_value,
+        "Reject model": conditional_coverage_p_value < significance, # conditional coverage tests both properties at once
+        "Traffic light": zone
+    }, index=labels);
+
 def EWMA_volatility(input_file, alpha):
     """
     It returns volatility of returns calculated using the Exponentially Weighted Moving Average (EWMA) model:
@@ -177,7 +533,7 @@ def EWMA_volatility(input_file, alpha):
     'Adj. close': 'float',
     'Log return': 'float'
     };
-    return_history = PD.read_csv(input_file, header=0, index_col=0, parse_dates=True, dtype=dtype_dict, thousands=',');
+    return_history = Load_price_history(input_file, dtype_dict);
     observations = len(return_history['Log return']); # number of total observations
     
     # Creates a new column for squared log returns and populates it:
@@ -194,3 +550,303 @@ def EWMA_volatility(input_file, alpha):
     
     # It calculates and returns the volatility:
     return math.sqrt(return_history['Weight Sq log return'].sum());
+
+def EWMA_volatility_series(log_returns, decay=0.94, initial_variance=None):
+    """
+    It returns the full time series of EWMA volatility, for many series (e.g. tickers) at once, with the RiskMetrics recursion:
+    σ^2(t) = λσ^2(t-1) + (1-λ)r^2(t-1), where λ is the decay factor (0.94 for daily data in RiskMetrics).
+    'log_returns': a 1-d array (one series) or 2-d array (one column per series), oldest observation first; a DataFrame or Series
+        is sorted by its index first and the result is returned with the same index and columns
+    'initial_variance': σ^2(0) for each series; the first squared return is used if not given
+    σ(t) is the forecast for day t made with the returns up to day t-1, so row t of the result lines up with row t of the input.
+    The recursion is a first-order linear filter, so it is run by scipy.signal.lfilter over all series in O(n) compiled code.
+    """
+    if (decay >= 1 or decay <= 0):
+        print("The decay factor must be less than 1 and more than 0!");
+        return None;
+    if len(log_returns) == 0:
+        print("There are no returns!");
+        return None;
+    labels = None;
+    if isinstance(log_returns, (PD.DataFrame, PD.Series)):
+        log_returns = log_returns.sort_index();
+        labels = log_returns;
+        log_returns = log_returns.to_numpy(dtype=float);
+    squared_returns = NP.asarray(log_returns, dtype=float)**2;
+    if initial_variance is None:
+        initial_variance = squared_returns[0];
+    initial_state = NP.broadcast_to(NP.asarray(initial_variance, dtype=float), squared_returns.shape[1:])[NP.newaxis];
+    # y(t) = λy(t-1) + (1-λ)x(t-1), started from y(0) = initial variance:
+    variances = scipy.signal.lfilter([0, 1-decay], [1, -decay], squared_returns, axis=0, zi=initial_state)[0];
+    volatilities = NP.sqrt(variances);
+    if labels is not None:
+        if isinstance(labels, PD.Series):
+            return PD.Series(volatilities, index=labels.index, name=labels.name);
+        return PD.DataFrame(volatilities, index=labels.index, columns=labels.columns);
+    return volatilities;
+
+class EWMA_tracker:
+    """
+    Stateful EWMA volatility for many instruments: each update() takes the latest return of every instrument and moves the
+    variance forecasts on by one day in O(1) per instrument, with the same recursion as EWMA_volatility_series().
+    'initial_variance': the current variance of each instrument, e.g. the square of the last value of EWMA_volatility_series()
+        updated with its last return (see from_series())
+    """
+    def __init__(self, initial_variance, decay=0.94):
+        if (decay >= 1 or decay <= 0):
+            raise ValueError("The decay factor must be less than 1 and more than 0!");
+        self.decay = decay;
+        self.variance = NP.array(initial_variance, dtype=float);
+
+    @classmethod
+    def from_series(cls, log_returns, decay=0.94, initial_variance=None):
+        """
+        Creates a tracker whose forecast is for the day after the last return in 'log_returns' (as in EWMA_volatility_series()).
+        """
+        if (decay >= 1 or decay <= 0):
+            raise ValueError("The decay factor must be less than 1 and more than 0!");
+        volatilities = NP.asarray(EWMA_volatility_series(log_returns, decay, initial_variance), dtype=float);
+        last_returns = NP.asarray(log_returns.sort_index() if isinstance(log_returns, (PD.DataFrame, PD.Series)) else log_returns, dtype=float)[-1];
+        return cls(decay*volatilities[-1]**2 + (1-decay)*last_returns**2, decay);
+
+    def update(self, latest_returns):
+        """
+        Takes the latest return of each instrument and returns the volatility forecasts for the next day.
+        """
+        self.variance = self.decay*self.variance + (1-self.decay)*NP.asarray(latest_returns, dtype=float)**2;
+        return self.volatility;
+
+    @property
+    def volatility(self):
+        return NP.sqrt(self.variance);
+
+class _Sorted_values:
+    """
+    A sorted multiset of floats for Rolling_VaR, with O(log n) insertion, removal, rank and k-th smallest value. The values
+    are kept in sorted buckets of up to 2*LOAD values, whose largest values are bisected to find the bucket of a value; a
+    Fenwick (binary indexed) tree over the bucket sizes finds the bucket of a rank, and the number of values before a bucket.
+    """
+    LOAD = 64;
+
+    def __init__(self):
+        self._buckets = []; # sorted lists, each value at most the first value of the next bucket
+        self._maxes = []; # the last value of each bucket
+        self._tree = [0]; # Fenwick tree of the bucket sizes, 1-based
+        self._size = 0;
+
+    def __len__(self):
+        return self._size;
+
+    def __iter__(self):
+        for bucket in self._buckets:
+            yield from bucket;
+
+    def _build_tree(self):
+        # O(number of buckets), after a bucket is split or removed
+        tree = [0] + [len(bucket) for bucket in self._buckets];
+        for i in range(1, len(tree)):
+            parent = i + (i & -i);
+            if parent < len(tree):
+                tree[parent] += tree[i];
+        self._tree = tree;
+
+    def _tree_add(self, index, change):
+        tree, i = self._tree, index + 1;
+        while i < len(tree):
+            tree[i] += change;
+            i += i & -i;
+
+    def _count_before(self, index):
+        # The number of values in the buckets before this one
+        count, i = 0, index;
+        while i > 0:
+            count += self._tree[i];
+            i -= i & -i;
+        return count;
+
+    def __getitem__(self, rank):
+        # The value of this rank (0 is the smallest); the ranks of the VaR tail are usually in the first bucket
+        first = self._buckets[0];
+        if rank < len(first):
+            return first[rank];
+        # Otherwise by descending the Fenwick tree:
+        tree = self._tree;
+        index, remaining, step = 0, rank, 1 << (len(tree) - 1).bit_length();
+        while step:
+            if index + step < len(tree) and tree[index + step] <= remaining:
+                index += step;
+                remaining -= tree[index];
+            step >>= 1;
+        return self._buckets[index][remaining];
+
+    def rank(self, value):
+        """
+        The number of values strictly below 'value'.
+        """
+        index = bisect.bisect_left(self._maxes, value);
+        if index == len(self._maxes):
+            return self._size;
+        return self._count_before(index) + bisect.bisect_left(self._buckets[index], value);
+
+    def add(self, value):
+        """
+        Inserts the value and returns its rank.
+        """
+        self._size += 1;
+        if not self._buckets:
+            self._buckets.append([value]);
+            self._maxes.append(value);
+            self._build_tree();
+            return 0;
+        index = min(bisect.bisect_left(self._maxes, value), len(self._buckets) - 1);
+        bucket = self._buckets[index];
+        position = bisect.bisect_right(bucket, value);
+        bucket.insert(position, value);
+        self._maxes[index] = bucket[-1];
+        rank = self._count_before(index) + position;
+        if len(bucket) > 2*self.LOAD:
+            self._buckets[index:index+1] = [bucket[:self.LOAD], bucket[self.LOAD:]];
+            self._maxes[index:index+1] = [bucket[self.LOAD-1], bucket[-1]];
+            self._build_tree();
+        else:
+            self._tree_add(index, 1);
+        return rank;
+
+    def remove(self, value):
+        """
+        Removes one occurrence of the value, which must be present, and returns the rank it had.
+        """
+        self._size -= 1;
+        index = bisect.bisect_left(self._maxes, value);
+        bucket = self._buckets[index];
+        position = bisect.bisect_left(bucket, value);
+        rank = self._count_before(index) + position;
+        del bucket[position];
+        if bucket:
+            self._maxes[index] = bucket[-1];
+            self._tree_add(index, -1);
+        else:
+            del self._buckets[index], self._maxes[index];
+            self._build_tree();
+        return rank;
+
+class Rolling_VaR:
+    """
+    Streaming Value-at-Risk, expected shortfall and volatility over a fixed look-back window of log returns.
+    Returns are fed one at a time (or in batches) with update(); the statistics are available after every update and are
+    calculated the same way as in Stats_on_csv() (VaR from the 'nearest' quantile, ES as the average of the returns below the
+    linearly interpolated quantile, volatility as the sample standard deviation scaled by the square root of the look-back period).
+    The window is kept in a ring buffer and, alongside it, in sorted order (_Sorted_values), so each update costs O(log n) and
+    the quantile is read off directly instead of sorting the history again. The sum of the returns up to the quantile is kept
+    up to date with each update, so the expected shortfall does not add up the tail again either.
+    Look-back period is in years; the window holds lookback_period*business_days returns.
+    """
+    def __init__(self, lookback_period, confidence_level, business_days=252):
+        if (confidence_level > 1 or confidence_level <= 0):
+            raise ValueError("The confidence level must be less than 1 and more than 0!");
+        self.lookback_period = lookback_period;
+        self.confidence_level = confidence_level;
+        self.window = int(lookback_period*business_days);
+        self._buffer = NP.empty(self.window); # ring buffer of the returns in the window, in arrival order
+        self._position = 0; # index in the buffer for the next return
+        self._count = 0; # number of returns currently in the window
+        self._sorted = _Sorted_values(); # the same returns in ascending order
+        self._sum = 0.0;
+        self._sum_of_squares = 0.0;
+        self._tail_size = 0; # the number of smallest returns in _tail_sum: up to the lower neighbour of the quantile
+        self._tail_sum = 0.0;
+        self._updates_since_resum = 0;
+
+    def update(self, log_return):
+        """
+        Adds a return to the window, dropping the oldest one if the window is full. NaN returns are ignored.
+        """
+        if math.isnan(log_return):
+            return;
+        log_return = float(log_return);
+        if self._count == self.window: # the oldest return leaves the window
+            oldest = float(self._buffer[self._position]);
+            if self._sorted.remove(oldest) < self._tail_size:
+                self._tail_sum -= oldest;
+                if len(self._sorted) >= self._tail_size:
+                    self._tail_sum += self._sorted[self._tail_size - 1]; # the next return moves into the tail
+            self._sum -= oldest;
+            self._sum_of_squares -= oldest**2;
+        else:
+            self._count += 1;
+        self._buffer[self._position] = log_return;
+        self._position = (self._position + 1) % self.window;
+        if self._sorted.add(log_return) < self._tail_size:
+            self._tail_sum += log_return;
+            if len(self._sorted) > self._tail_size:
+                self._tail_sum -= self._sorted[self._tail_size]; # the largest return of the tail moves out of it
+        self._sum += log_return;
+        self._sum_of_squares += log_return**2;
+        self._resize_tail(math.floor(self._quantile_position()) + 1);
+        # The running sums are recalculated once per window length, so rounding errors cannot build up:
+        self._updates_since_resum += 1;
+        if self._updates_since_resum >= self.window:
+            self._sum = math.fsum(self._sorted);
+            self._sum_of_squares = math.fsum(x**2 for x in self._sorted);
+            self._tail_sum = math.fsum(itertools.islice(self._sorted, self._tail_size));
+            self._updates_since_resum = 0;
+
+    def _resize_tail(self, tail_size):
+        # Moves returns into or out of the tail sum until it holds the 'tail_size' smallest
+        while self._tail_size < tail_size:
+            self._tail_sum += self._sorted[self._tail_size];
+            self._tail_size += 1;
+        while self._tail_size > tail_size:
+            self._tail_size -= 1;
+            self._tail_sum -= self._sorted[self._tail_size];
+
+    def update_batch(self, log_returns):
+        """
+        Adds a sequence of returns, oldest first.
+        """
+        for log_return in log_returns:
+            self.update(float(log_return));
+
+    def _quantile_position(self):
+        return (self._count - 1) * (1 - self.confidence_level); # same position as numpy/pandas quantiles
+
+    @property
+    def VaR(self):
+        if self._count == 0:
+            return math.nan;
+        return -self._sorted[round(self._quantile_position())]; # 'nearest' interpolation (round half to even)
+
+    @property
+    def expected_shortfall(self):
+        if self._count == 0:
+            return math.nan;
+        # The linearly interpolated quantile, calculated as numpy does:
+        position = self._quantile_position();
+        lower = math.floor(position);
+        upper = min(lower + 1, self._count - 1);
+        fraction = position - lower;
+        lower_value, upper_value = self._sorted[lower], self._sorted[upper];
+        difference = upper_value - lower_value;
+        quantile = lower_value + difference*fraction if fraction < 0.5 else upper_value - difference*(1 - fraction);
+        tail_size = self._sorted.rank(quantile); # the returns strictly below the quantile
+        if tail_size == 0:
+            return math.nan;
+        # The tail sum holds the returns up to rank 'lower'; those from rank tail_size on equal lower_value (= the quantile):
+        return -(self._tail_sum - (self._tail_size - tail_size)*lower_value) / tail_size;
+
+    @property
+    def volatility(self):
+        if self._count < 2:
+            return math.nan;
+        variance = (self._sum_of_squares - self._sum**2/self._count) / (self._count - 1);
+        return math.sqrt(max(variance, 0.0)) * math.sqrt(self.lookback_period);
+
+    def stats(self):
+        """
+        The current statistics, in the same format as Stats_on_csv().
+        """
+        return {
+            "VaR": round(self.VaR,4),
+            "Expected shortfall": round(self.expected_shortfall,4),
+            "Volatility": round(self.volatility,4)
+        };
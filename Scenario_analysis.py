@@ -0,0 +1,158 @@
+"""
+Revaluation of a book of options, forwards and futures under a grid of scenarios: spot shocks × volatility shocks × time
+shifts (e.g. 40×20×5 for a daily risk ladder), all in broadcast NumPy operations instead of one pricing call per position
+and scenario. European options are valued with BSM and American options with the approximations of American_approximations.
+Example:
+    results = Scenario_analysis.Scenario_revaluation(book, position_sizes, 100, 0.05, 0.2, 0.01,
+                                                     spot_shocks=NP.linspace(-0.2, 0.2, 41), volatility_shocks=NP.linspace(-0.1, 0.1, 21),
+                                                     time_shifts=NP.arange(5)/252);
+    results["P&L"][i, j, k] # P&L of the whole book for spot shock i, volatility shock j and time shift k
+"""
+import numpy as NP;
+import Products_and_Pricing as PaP; # for the product classes
+from Products_and_Pricing import special; # scipy.special, loaded on first use
+import American_approximations; # for the values of American options
+
+_OPTION = 0; # European options
+_LINEAR = 1; # forwards and futures, whose values do not depend on volatility
+_AMERICAN = 2;
+# The approximate number of arrays of the scenario grid's size alive at once while a chunk of positions of each kind is
+# valued (the bivariate normal distribution of Bjerksund-Stensland is integrated at 20 points per scenario):
+_WORKING_ARRAYS = {_OPTION: 10, _LINEAR: 10, _AMERICAN: 100};
+
+def _book_columns(book):
+    """
+    The columns of a book as arrays: the kind of each position (_OPTION, _AMERICAN or _LINEAR), whether it is a call, whether
+    it is American, its strike (or forward) price, its time to expiry and its contract multiplier (the lot size of a future,
+    1 otherwise).
+    'book': an Option_book, or a list of Option, Forward and Future objects in any mix
+    """
+    if isinstance(book, PaP.Option_book):
+        size = len(book);
+        return {'kind': NP.where(book.is_american, _AMERICAN, _OPTION).astype(NP.int8), 'is_call': book.is_call,
+                'is_american': book.is_american,
+                'strike_price': book.strike_price, 'time_to_expiry': book.time_to_expiry, 'multiplier': NP.ones(size)};
+    is_option = [isinstance(instrument, PaP.Option) for instrument in book];
+    return {
+        'kind': NP.array([(_AMERICAN if instrument.option_style == 'American' else _OPTION) if option else _LINEAR
+                          for instrument, option in zip(book, is_option)], dtype=NP.int8),
+        'is_call': NP.array([option and instrument.option_type == 'call' for instrument, option in zip(book, is_option)], dtype=bool),
+        'is_american': NP.array([option and instrument.option_style == 'American' for instrument, option in zip(book, is_option)], dtype=bool),
+        'strike_price': NP.array([instrument.strike_price if option else instrument.forward_price
+                                  for instrument, option in zip(book, is_option)], dtype=float),
+        'time_to_expiry': NP.array([instrument.time_to_expiry for instrument in book], dtype=float),
+        'multiplier': NP.array([getattr(instrument, 'lot_size', 1) for instrument in book], dtype=float)
+    };
+
+def _option_values(is_call, shocked_spot, K, T, Rf, sigma, q):
+    """
+    BSM values of options broadcast over the scenario axes. The arguments are shaped (positions, spot, volatility, time), with
+    length 1 along the axes they do not depend on, so each term is calculated only for the scenarios it varies with: the
+    discount factors per time shift, sigma*sqrt(T) and the drift per volatility and time shift, and only d1, d2 and the normal
+    distribution function over the whole grid. Puts are valued from the calls by put-call parity.
+    Expired options (and options with zero volatility) are worth their intrinsic value on the forward.
+    """
+    sigma_sqrt_T = sigma*NP.sqrt(T);
+    drift = (Rf - q + sigma**2/2)*T;
+    discounted_S0 = shocked_spot*NP.exp(-q*T);
+    discounted_K = K*NP.exp(-Rf*T);
+    with NP.errstate(divide='ignore', invalid='ignore'):
+        d1 = (NP.log(shocked_spot/K) + drift) / sigma_sqrt_T;
+        d2 = d1 - sigma_sqrt_T;
+        call_values = discounted_S0*special.ndtr(d1) - discounted_K*special.ndtr(d2);
+    call_values = NP.where(sigma_sqrt_T > 0, call_values, NP.maximum(discounted_S0 - discounted_K, 0.0));
+    return NP.where(is_call, call_values, call_values - discounted_S0 + discounted_K); # put-call parity
+
+def _American_values(is_call, shocked_spot, K, T, Rf, sigma, q, method):
+    """
+    Values of American options broadcast over the scenario axes as in _option_values(), with the approximation 'method' (one of
+    American_approximations.METHODS). Expired options, and options with zero volatility, are worth the larger of their
+    intrinsic value and their European value.
+    """
+    shape = NP.broadcast_shapes(*[NP.shape(x) for x in (is_call, shocked_spot, K, T, Rf, sigma, q)]);
+    alive = NP.broadcast_to(sigma*NP.sqrt(T) > 0, shape);
+    exercise_value = NP.maximum(NP.where(is_call, shocked_spot - K, K - shocked_spot), 0.0);
+    values = NP.maximum(_option_values(is_call, shocked_spot, K, T, Rf, sigma, q), exercise_value);
+    inputs = [NP.broadcast_to(x, shape)[alive] for x in (is_call, K, T, shocked_spot, Rf, sigma, q)];
+    values[alive] = American_approximations.American_price_batch(*inputs, method);
+    return values;
+
+def _values(columns, rows, underlying_price, Rf, sigma, q, spot_shocks, volatility_shocks, time_shifts, relative_spot_shocks,
+            American_method):
+    """
+    Values of the positions 'rows' (an index array of positions of the same kind) under every scenario, per unit of position,
+    shaped (positions, spot, volatility, time).
+    """
+    def column(values):
+        return values[rows][:, None, None, None];
+    if relative_spot_shocks:
+        shocked_spot = column(underlying_price)*(1 + spot_shocks[None, :, None, None]);
+    else:
+        shocked_spot = column(underlying_price) + spot_shocks[None, :, None, None];
+    T = NP.maximum(column(columns['time_to_expiry']) - time_shifts[None, None, None, :], 0.0);
+    K = column(columns['strike_price']);
+    if columns['kind'][rows[0]] == _LINEAR:
+        values = (shocked_spot - K*NP.exp(-column(Rf)*T)) * column(columns['multiplier']); # as Forward.value() and Future.value()
+        return NP.broadcast_to(values, (len(rows), len(spot_shocks), len(volatility_shocks), len(time_shifts)));
+    shocked_sigma = NP.maximum(column(sigma) + volatility_shocks[None, None, :, None], 0.0);
+    if columns['kind'][rows[0]] == _AMERICAN:
+        return _American_values(column(columns['is_call']), shocked_spot, K, T, column(Rf), shocked_sigma, column(q),
+                                American_method) * column(columns['multiplier']);
+    return _option_values(column(columns['is_call']), shocked_spot, K, T, column(Rf), shocked_sigma, column(q)) \
+           * column(columns['multiplier']);
+
+def Scenario_revaluation(book, position_sizes, underlying_price, risk_free_interest_rate, volatility, dividend_yield,
+                         spot_shocks, volatility_shocks, time_shifts, relative_spot_shocks=True, by_position=True,
+                         memory_limit=256*2**20, American_method='Bjerksund-Stensland'):
+    """
+    Revalues every position of a book under every combination of the shocks and returns the P&L against today's values.
+    'book': an Option_book, or a list of Option, Forward and Future objects in any mix
+    'position_sizes': the number of contracts of each position (negative for short positions), or a single number for all
+    The market inputs can be scalars or arrays with one value per position (e.g. volatilities read off a Volatility_surface).
+    'spot_shocks': relative changes of the underlying price (e.g. -0.1 for a 10% fall), or absolute changes if
+        relative_spot_shocks is false
+    'volatility_shocks': absolute changes of volatility (e.g. 0.05 for +5 volatility points); shocked volatilities are floored at 0
+    'time_shifts': time elapsed in years (e.g. 1/252 for one business day); positions that expire are worth their intrinsic value
+    'by_position': also return the P&L of each position; if false, only the aggregate is kept and memory use does not grow with
+        the size of the book
+    'memory_limit': the approximate number of bytes of working memory; the book is revalued in chunks of positions that fit
+    'American_method': the approximation American options are valued with, one of American_approximations.METHODS
+    Forwards and futures are valued as in Forward.value() and Future.value(), on the shocked underlying price; European options
+    with BSM and American options with American_approximations.American_price_batch().
+    Returns a dictionary with the shocks, today's value of each position ("Base value") and the P&L cubes, shaped
+    (spot shocks, volatility shocks, time shifts) for the book ("P&L") and (positions, ...) by position ("P&L by position").
+    """
+    columns = _book_columns(book);
+    size = len(columns['kind']);
+    spot_shocks, volatility_shocks, time_shifts = [NP.atleast_1d(NP.asarray(shocks, dtype=float))
+                                                   for shocks in (spot_shocks, volatility_shocks, time_shifts)];
+    position_sizes, underlying_price, Rf, sigma, q = [NP.broadcast_to(NP.asarray(x, dtype=float), (size,)) for x in
+                                                      (position_sizes, underlying_price, risk_free_interest_rate, volatility, dividend_yield)];
+    scenario_shape = (len(spot_shocks), len(volatility_shocks), len(time_shifts));
+
+    no_shock = NP.zeros(1);
+    base_value = NP.empty(size);
+    total = NP.zeros(scenario_shape);
+    by_position_PnL = NP.empty((size,) + scenario_shape) if by_position else None;
+    for kind in (_OPTION, _AMERICAN, _LINEAR):
+        rows_of_kind = NP.flatnonzero(columns['kind'] == kind);
+        chunk_size = max(1, int(memory_limit // (_WORKING_ARRAYS[kind]*8*int(NP.prod(scenario_shape)))));
+        for start in range(0, len(rows_of_kind), chunk_size):
+            rows = rows_of_kind[start:start+chunk_size];
+            base = _values(columns, rows, underlying_price, Rf, sigma, q, no_shock, no_shock, no_shock,
+                           relative_spot_shocks, American_method)[:, 0, 0, 0];
+            base_value[rows] = base;
+            PnL = (_values(columns, rows, underlying_price, Rf, sigma, q, spot_shocks, volatility_shocks, time_shifts,
+                           relative_spot_shocks, American_method) - base[:, None, None, None]) \
+                  * position_sizes[rows][:, None, None, None];
+            total += PnL.sum(axis=0);
+            if by_position:
+                by_position_PnL[rows] = PnL;
+    return {
+        "Spot shocks": spot_shocks,
+        "Volatility shocks": volatility_shocks,
+        "Time shifts": time_shifts,
+        "Base value": base_value,
+        "P&L": total,
+        "P&L by position": by_position_PnL
+    };
@@ -0,0 +1,127 @@
+import numpy as NP;
+import Products_and_Pricing as PaP; # for the batch implied volatility solver
+from Lazy_import import Lazy_import;
+scipy = Lazy_import('scipy');
+Lazy_import('scipy.interpolate');
+
+class Volatility_surface:
+    """
+    Implied volatility surface built from a chain of market prices of European options, for fast lookups of σ(K, T).
+    All prices are inverted at once with BSM_implied_volatility_batch(). Each expiry (slice) is then described by its total
+    implied variance w = σ^2*T as a function of log-moneyness k = ln(K/F), where F = S0e^((r-q)T) is the forward price:
+    - only out-of-the-money quotes are used (puts below the forward, calls above it), as they are the more liquid and their
+      prices are most sensitive to volatility; all converged quotes are used if a slice has fewer than two of them
+    - the smile is interpolated with a shape-preserving (PCHIP) spline, which does not overshoot between quotes and so does
+      not create the spurious wiggles that imply negative probabilities; beyond the quoted strikes it is flat
+    - total variance must not decrease with expiry (no calendar arbitrage), so at each moneyness it is replaced by its running
+      maximum across expiries
+    The slices are precomputed on a uniform grid of log-moneyness, so a lookup is index arithmetic and linear interpolation:
+    along the grid in moneyness and in total variance between expiries (before the first and after the last expiry the volatility
+    is kept constant). Lookups are vectorised over any number of points.
+    A single expiry can be refreshed with update_slice() without inverting or interpolating the other slices again.
+    'grid_points': the number of log-moneyness grid points
+    """
+    def __init__(self, option_type, strike_price, time_to_expiry, option_price, underlying_price, risk_free_interest_rate,
+                 dividend_yield, grid_points=201):
+        self.underlying_price = underlying_price;
+        self.risk_free_interest_rate = risk_free_interest_rate;
+        self.dividend_yield = dividend_yield;
+        option_type, strike_price, time_to_expiry, option_price = [NP.asarray(x) for x in NP.broadcast_arrays(
+            PaP._call_flags(option_type), NP.asarray(strike_price, dtype=float), NP.asarray(time_to_expiry, dtype=float),
+            NP.asarray(option_price, dtype=float))];
+
+        # The grid spans the moneyness of all quotes, with some room on either side:
+        log_moneyness = NP.log(strike_price / self._forward(time_to_expiry));
+        margin = 0.1*(log_moneyness.max() - log_moneyness.min()) + 0.01;
+        self.log_moneyness_grid = NP.linspace(log_moneyness.min() - margin, log_moneyness.max() + margin, grid_points);
+
+        self.expiries = NP.unique(time_to_expiry);
+        self._slice_total_variance = NP.empty((len(self.expiries), grid_points)); # before the calendar adjustment
+        for i, expiry in enumerate(self.expiries):
+            in_slice = time_to_expiry == expiry;
+            self._slice_total_variance[i] = self._fit_slice(option_type[in_slice], strike_price[in_slice], expiry, option_price[in_slice]);
+        self._apply_calendar_constraint();
+
+    def _forward(self, time_to_expiry, underlying_price=None):
+        underlying_price = self.underlying_price if underlying_price is None else underlying_price;
+        return underlying_price*NP.exp((self.risk_free_interest_rate - self.dividend_yield)*time_to_expiry);
+
+    def _fit_slice(self, is_call, strike_price, expiry, option_price):
+        """
+        Inverts the quotes of one expiry and returns its total variance on the moneyness grid.
+        """
+        results = PaP.BSM_implied_volatility_batch(is_call, option_price, strike_price, expiry, self.underlying_price,
+                                                   self.risk_free_interest_rate, self.dividend_yield);
+        converged = results["Converged"];
+        if not converged.any():
+            raise ValueError("None of the prices for expiry %g could be inverted!" % expiry);
+        forward = self._forward(expiry);
+        out_of_the_money = converged & ((is_call & (strike_price >= forward)) | (~is_call & (strike_price < forward)));
+        use = out_of_the_money if out_of_the_money.sum() >= 2 else converged;
+
+        # Total variance by log-moneyness, averaging quotes at the same strike:
+        log_moneyness, inverse = NP.unique(NP.log(strike_price[use] / forward), return_inverse=True);
+        total_variance = NP.bincount(inverse, weights=results["Implied volatility"][use]**2*expiry) / NP.bincount(inverse);
+        if len(log_moneyness) == 1:
+            return NP.full(len(self.log_moneyness_grid), total_variance[0]);
+        smile = scipy.interpolate.PchipInterpolator(log_moneyness, total_variance, extrapolate=False);
+        return smile(NP.clip(self.log_moneyness_grid, log_moneyness[0], log_moneyness[-1])); # flat beyond the quotes
+
+    def _apply_calendar_constraint(self):
+        self.total_variance = NP.maximum.accumulate(self._slice_total_variance, axis=0);
+
+    def update_slice(self, option_type, strike_price, time_to_expiry, option_price):
+        """
+        Refits one expiry from new quotes (all with the same time_to_expiry), or adds it if the surface does not have it yet.
+        Only that slice is inverted and interpolated; the calendar constraint is then reapplied across the grid.
+        """
+        is_call, strike_price, option_price = NP.broadcast_arrays(PaP._call_flags(option_type), NP.asarray(strike_price, dtype=float),
+                                                                  NP.asarray(option_price, dtype=float));
+        row = self._fit_slice(is_call, strike_price, time_to_expiry, option_price);
+        position = NP.searchsorted(self.expiries, time_to_expiry);
+        if position < len(self.expiries) and self.expiries[position] == time_to_expiry:
+            self._slice_total_variance[position] = row;
+        else:
+            self.expiries = NP.insert(self.expiries, position, time_to_expiry);
+            self._slice_total_variance = NP.insert(self._slice_total_variance, position, row, axis=0);
+        self._apply_calendar_constraint();
+
+    def volatility(self, strike_price, time_to_expiry, underlying_price=None):
+        """
+        Interpolated implied volatility for any number of (strike, expiry) points; the arguments broadcast against each other.
+        'underlying_price': the current price of the underlying, if different from the one the surface was built with; the
+            surface is then read at the same moneyness (sticky moneyness)
+        """
+        strike_price, time_to_expiry = NP.broadcast_arrays(NP.asarray(strike_price, dtype=float), NP.asarray(time_to_expiry, dtype=float));
+        grid = self.log_moneyness_grid;
+        # Position on the moneyness grid (clipped to its ends) as an integer index plus a fraction:
+        position = NP.clip((NP.log(strike_price / self._forward(time_to_expiry, underlying_price)) - grid[0]) / (grid[1] - grid[0]),
+                           0, len(grid) - 1);
+        lower = NP.minimum(position.astype(int), len(grid) - 2);
+        fraction = position - lower;
+
+        def slice_variance(slice_index):
+            return self.total_variance[slice_index, lower]*(1 - fraction) + self.total_variance[slice_index, lower + 1]*fraction;
+
+        # Linear interpolation in total variance between the expiries around each point:
+        after = NP.clip(NP.searchsorted(self.expiries, time_to_expiry), 1, len(self.expiries) - 1) if len(self.expiries) > 1 else NP.zeros(time_to_expiry.shape, dtype=int);
+        before = NP.maximum(after - 1, 0);
+        T_before, T_after = self.expiries[before], self.expiries[after];
+        w_before, w_after = slice_variance(before), slice_variance(after);
+        with NP.errstate(divide='ignore', invalid='ignore'):
+            weight = NP.where(T_after > T_before, (time_to_expiry - T_before) / (T_after - T_before), 0.0);
+        total_variance = w_before + (w_after - w_before)*weight;
+        # Outside the quoted expiries the volatility of the nearest slice is kept:
+        total_variance = NP.where(time_to_expiry < self.expiries[0], slice_variance(0)*time_to_expiry/self.expiries[0], total_variance);
+        total_variance = NP.where(time_to_expiry > self.expiries[-1], slice_variance(len(self.expiries) - 1)*time_to_expiry/self.expiries[-1],
+                                  total_variance);
+        volatility = NP.sqrt(NP.maximum(total_variance, 0.0) / time_to_expiry);
+        return volatility.item() if volatility.ndim == 0 else volatility;
+
+    def price(self, option_type, strike_price, time_to_expiry, underlying_price=None):
+        """
+        BSM prices of European options (e.g. at strikes that are not quoted) with the volatility read off the surface.
+        """
+        underlying_price = self.underlying_price if underlying_price is None else underlying_price;
+        return PaP.BSM_price_batch(option_type, strike_price, time_to_expiry, underlying_price, self.risk_free_interest_rate,
+                                   self.volatility(strike_price, time_to_expiry, underlying_price), self.dividend_yield);
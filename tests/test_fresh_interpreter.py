@@ -0,0 +1,70 @@
+"""
+Thread-safety checks that only mean something in a fresh interpreter, where the lazily imported modules (pandas, scipy) are
+not loaded yet, so that their first use happens from several threads at once. Each check runs its script with
+'python -c' in the repository folder and passes if the script exits with 0.
+Run with: python -m pytest tests
+"""
+import os;
+import subprocess;
+import sys;
+import pytest;
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)));
+sys.path.insert(0, REPOSITORY);
+import Benchmarks; # for the synthetic price histories
+
+def _run_fresh(script):
+    # Runs the script in a new interpreter and fails the test with the script's last error line
+    run = subprocess.run([sys.executable, '-c', script], cwd=REPOSITORY, capture_output=True, text=True);
+    assert run.returncode == 0, run.stderr.strip().splitlines()[-1] if run.stderr.strip() else "exit code %d" % run.returncode;
+
+@pytest.fixture
+def price_folder(tmp_path):
+    # 8 synthetic price histories, asset_0.csv to asset_7.csv
+    for seed in range(8):
+        Benchmarks.Synthetic_price_history(str(tmp_path / ('asset_%d.csv' % seed)), 600, seed=seed);
+    return str(tmp_path);
+
+def test_lazy_modules_loaded_from_8_threads():
+    _run_fresh("""
+import threading;
+import Products_and_Pricing as PaP, Risk_Metrics as RM;
+barrier = threading.Barrier(8);
+errors = [];
+def first_use(i):
+    barrier.wait();
+    try:
+        RM.PD.read_csv, RM.scipy.stats.norm.ppf;
+        PaP.BSM_price_batch('call', 100 + i, 1, 100, 0.05, 0.2, 0.0);
+    except Exception as error:
+        errors.append(error);
+threads = [threading.Thread(target=first_use, args=(i,)) for i in range(8)];
+for thread in threads: thread.start();
+for thread in threads: thread.join();
+if errors: raise errors[0];
+""");
+
+def test_Portfolio_VaR_with_8_workers(price_folder):
+    _run_fresh("""
+import Risk_Metrics as RM;
+results = RM.Portfolio_VaR(%r, [1/8]*8, 2, 0.99, workers=8);
+assert results is not None, "Portfolio_VaR returned None";
+""" % price_folder);
+
+def test_Quote_cache_implied_volatility_from_8_threads():
+    _run_fresh("""
+import threading;
+import Products_and_Pricing as PaP, Quote_cache;
+cache = Quote_cache.Quote_cache();
+barrier = threading.Barrier(8);
+results = {};
+def quote(i):
+    barrier.wait();
+    results[i] = cache.implied_volatility(PaP.Option('call', 'European', 90 + 5*i, 1), 8.0, 100, 0.05, 0.01);
+threads = [threading.Thread(target=quote, args=(i,)) for i in range(8)];
+for thread in threads: thread.start();
+for thread in threads: thread.join();
+for i in range(8):
+    expected = PaP.BSM_implied_volatility(PaP.Option('call', 'European', 90 + 5*i, 1), 8.0, 100, 0.05, 0.01);
+    assert results.get(i) == expected or (results.get(i) != results.get(i) and expected != expected), (i, results.get(i), expected);
+""");
@@ -0,0 +1,40 @@
+"""
+Invalidation of Quote_cache entries, including calculations that were running when their underlying price was invalidated.
+Run with: python -m pytest tests
+"""
+import os;
+import sys;
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))));
+import Products_and_Pricing as PaP;
+import Quote_cache;
+
+OPTION = PaP.Option('call', 'European', 100, 1);
+
+def test_result_invalidated_while_calculating_is_not_stored():
+    cache = Quote_cache.Quote_cache();
+    key = cache._key('price', OPTION, 100, 0.05, 0.2, 0.0);
+    def calculate():
+        cache.invalidate_underlying(100); # as another thread would, after the spot moved
+        return 1.0;
+    assert cache._cached(key, calculate) == 1.0;
+    assert cache.stats()["Entries"] == 0;
+    assert cache._cached(key, lambda: 2.0) == 2.0; # calculated again, and now stored
+    assert cache.stats()["Entries"] == 1;
+
+def test_result_cleared_while_calculating_is_not_stored():
+    cache = Quote_cache.Quote_cache();
+    key = cache._key('price', OPTION, 100, 0.05, 0.2, 0.0);
+    def calculate():
+        cache.clear();
+        return 1.0;
+    cache._cached(key, calculate);
+    assert cache.stats()["Entries"] == 0;
+
+def test_invalidate_underlying_drops_prices_within_the_tolerance():
+    # 100.0049 and 100.0051 round to neighbouring multiples of 0.01, so invalidating one must drop the other
+    cache = Quote_cache.Quote_cache(tolerance=0.01);
+    cache.price(OPTION, 100.0051, 0.05, 0.2, 0.0);
+    cache.price(OPTION, 101, 0.05, 0.2, 0.0);
+    assert cache.invalidate_underlying(100.0049) == 1;
+    assert cache.stats()["Entries"] == 1;
@@ -0,0 +1,35 @@
+"""
+Rolling_VaR against the same statistics calculated from scratch with numpy over each window.
+Run with: python -m pytest tests
+"""
+import math;
+import os;
+import sys;
+import numpy as NP;
+import pytest;
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))));
+import Risk_Metrics as RM;
+
+@pytest.mark.parametrize("lookback_period, confidence_level", [(0.5, 0.99), (2, 0.95), (1, 0.5)])
+def test_Rolling_VaR_matches_numpy(lookback_period, confidence_level):
+    generator = NP.random.default_rng(1);
+    # Rounded returns, so that there are ties at the quantile, and a few NaNs, which are skipped
+    returns = NP.round(generator.normal(0, 0.01, 1500), 3);
+    returns[generator.integers(0, 1500, 20)] = NP.nan;
+    rolling = RM.Rolling_VaR(lookback_period, confidence_level);
+    valid = returns[~NP.isnan(returns)];
+    seen = 0;
+    for log_return in returns:
+        rolling.update(log_return);
+        seen += not math.isnan(log_return);
+        if seen == 0 or seen % 7:
+            continue;
+        window = valid[max(seen - rolling.window, 0):seen];
+        VaR = -NP.quantile(window, 1 - confidence_level, method='nearest');
+        tail = window[window < NP.quantile(window, 1 - confidence_level)];
+        assert rolling.VaR == pytest.approx(VaR, abs=1e-12);
+        if tail.size:
+            assert rolling.expected_shortfall == pytest.approx(-tail.mean(), abs=1e-12);
+        else:
+            assert math.isnan(rolling.expected_shortfall);